@@ -0,0 +1,102 @@
+"""Per-request cost of resolving a bucket name, Hasura versus Postgres.
+
+The storage service resolves the bucket of every request through Hasura.
+This measures that lookup as a GraphQL query through Kong, then the same
+lookup as a prepared statement run by pgbench inside the postgres
+container, i.e. what a direct pooled connection costs. A bucket-metadata
+cache hit costs neither.
+
+    python bench/bucket_lookup.py --requests 2000
+"""
+import argparse
+import json
+import os
+import re
+import statistics
+import subprocess
+import time
+import uuid
+
+import requests
+
+QUERY = """
+query ($name: String!) {
+    storage_bucket(where: {name: {_eq: $name}}) { id owner }
+}
+"""
+
+PGBENCH_SCRIPT = "SELECT id FROM storage.bucket WHERE name = :name AND owner = :owner;\n"
+
+
+def sign_in(base_url):
+    payload = {"email": f"{uuid.uuid4()}@example.com", "password": "strongpassword"}
+    requests.post(f"{base_url}/auth/signup", json=payload).raise_for_status()
+    response = requests.post(f"{base_url}/auth/token?grant_type=password", json=payload)
+    response.raise_for_status()
+    return response.json()["access_token"]
+
+
+def summarize(samples):
+    samples = sorted(samples)
+    return {
+        "p50_ms": round(statistics.median(samples), 3),
+        "p99_ms": round(samples[int(len(samples) * 0.99) - 1], 3),
+        "mean_ms": round(statistics.fmean(samples), 3),
+    }
+
+
+def bench_hasura(session, url, bucket_name, count):
+    samples = []
+    owner = None
+    for _ in range(count):
+        start = time.perf_counter()
+        response = session.post(url, json={"query": QUERY, "variables": {"name": bucket_name}})
+        samples.append((time.perf_counter() - start) * 1000)
+        response.raise_for_status()
+        owner = response.json()["data"]["storage_bucket"][0]["owner"]
+    return summarize(samples), owner
+
+
+def bench_prepared(bucket_name, owner, count):
+    user = os.environ.get("POSTGRES_USER", "ogna_user")
+    database = os.environ.get("POSTGRES_DB", "ogna_db")
+    command = (
+        "cat > /tmp/bucket_lookup.sql && "
+        f"pgbench -n -M prepared -c 1 -t {count} -U {user} "
+        f"-D name='{bucket_name}' -D owner='{owner}' -f /tmp/bucket_lookup.sql {database}"
+    )
+    result = subprocess.run(
+        ["docker", "compose", "exec", "-T", "postgres", "sh", "-c", command],
+        input=PGBENCH_SCRIPT, capture_output=True, text=True
+    )
+    match = re.search(r"latency average = ([\d.]+) ms", result.stdout)
+    if not match:
+        return {"error": (result.stderr or result.stdout).strip()}
+    return {"mean_ms": float(match.group(1))}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--base-url", default="http://localhost:8000")
+    parser.add_argument("--requests", type=int, default=2000)
+    args = parser.parse_args()
+
+    token = sign_in(args.base_url)
+    session = requests.Session()
+    session.headers["Authorization"] = f"Bearer {token}"
+
+    bucket_name = f"bench-bucket-{uuid.uuid4()}"
+    session.post(f"{args.base_url}/storage/v1/buckets", json={"name": bucket_name, "public": False}).raise_for_status()
+
+    hasura, owner = bench_hasura(session, f"{args.base_url}/graphql", bucket_name, args.requests)
+    prepared = bench_prepared(bucket_name, owner, args.requests)
+
+    print(json.dumps({
+        "requests": args.requests,
+        "hasura_through_kong": hasura,
+        "postgres_prepared": prepared,
+    }, indent=2))
+
+
+if __name__ == "__main__":
+    main()
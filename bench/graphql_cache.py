@@ -0,0 +1,78 @@
+"""Latency of /graphql with and without the graphql-cache plugin.
+
+Runs the same bucket listing through Kong as a plain query (Hasura parses,
+validates and plans it every time), as an @cached query (answered from
+Redis after the first request) and as a persisted query sent by hash.
+
+    python bench/graphql_cache.py --requests 500
+
+Each variant runs as its own user, keep --requests under the per-user
+minute limit of /graphql or raise it first.
+"""
+import argparse
+import hashlib
+import json
+import statistics
+import time
+import uuid
+
+import requests
+
+QUERY = "query list_buckets { storage_bucket(order_by: {name: asc}) { id name } }"
+
+VARIANTS = {
+    "uncached": {"query": QUERY},
+    "cached": {"query": QUERY.replace("list_buckets", "list_buckets @cached", 1)},
+    "persisted": {"extensions": {"persistedQuery": {
+        "version": 1, "sha256Hash": hashlib.sha256(QUERY.encode()).hexdigest(),
+    }}},
+}
+
+
+def sign_in(base_url):
+    payload = {"email": f"{uuid.uuid4()}@example.com", "password": "strongpassword"}
+    requests.post(f"{base_url}/auth/signup", json=payload).raise_for_status()
+    response = requests.post(f"{base_url}/auth/token?grant_type=password", json=payload)
+    response.raise_for_status()
+    return response.json()["access_token"]
+
+
+def measure(session, url, body, count):
+    samples, hits = [], 0
+    for _ in range(count):
+        start = time.perf_counter()
+        response = session.post(url, json=body)
+        samples.append((time.perf_counter() - start) * 1000)
+        response.raise_for_status()
+        hits += response.headers.get("X-Cache-Status") == "Hit"
+    samples.sort()
+    return {
+        "p50_ms": round(statistics.median(samples), 3),
+        "p99_ms": round(samples[int(len(samples) * 0.99) - 1], 3),
+        "mean_ms": round(statistics.fmean(samples), 3),
+        "hit_ratio": round(hits / count, 3),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--base-url", default="http://localhost:8000")
+    parser.add_argument("--requests", type=int, default=500)
+    parser.add_argument("--buckets", type=int, default=20)
+    args = parser.parse_args()
+
+    url = f"{args.base_url}/graphql"
+    results = {}
+    for name, body in VARIANTS.items():
+        session = requests.Session()
+        session.headers["Authorization"] = f"Bearer {sign_in(args.base_url)}"
+        for _ in range(args.buckets):
+            session.post(f"{args.base_url}/storage/v1/buckets",
+                         json={"name": f"bench-bucket-{uuid.uuid4()}", "public": False}).raise_for_status()
+        results[name] = measure(session, url, body, args.requests)
+
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
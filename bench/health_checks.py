@@ -0,0 +1,76 @@
+"""Latest-status query cost over a large health-check history.
+
+Inside a transaction that is rolled back at the end, fills today's history
+partition with --rows checks spread over --services services, then times
+the former DISTINCT ON over the history against
+checks.get_latest_service_status(), which only reads checks.latest_status.
+Runs psql inside the postgres container.
+
+    python bench/health_checks.py --rows 100000000
+"""
+import argparse
+import json
+import os
+import re
+import subprocess
+
+SCRIPT = """
+BEGIN;
+
+INSERT INTO checks.health_check_history (service_name, status, last_checked_at, response_time_ms)
+SELECT
+    'bench-service-' || (g % {services}),
+    CASE WHEN g % 97 = 0 THEN 'unhealthy' ELSE 'healthy' END,
+    date_trunc('day', LOCALTIMESTAMP) + (g % 86400000) * INTERVAL '1 millisecond',
+    (g % 500)::INTEGER
+FROM generate_series(1, {rows}) AS g;
+
+INSERT INTO checks.latest_status (service_name, status, last_checked_at, response_time_ms)
+SELECT DISTINCT ON (service_name) service_name, status, last_checked_at, response_time_ms
+FROM checks.health_check_history
+WHERE service_name LIKE 'bench-service-%'
+ORDER BY service_name, last_checked_at DESC;
+
+ANALYZE checks.health_check_history;
+ANALYZE checks.latest_status;
+
+EXPLAIN (ANALYZE, BUFFERS)
+SELECT DISTINCT ON (service_name) service_name, status, last_checked_at, error_message, response_time_ms
+FROM checks.health_check_history
+ORDER BY service_name, last_checked_at DESC;
+
+EXPLAIN (ANALYZE, BUFFERS)
+SELECT * FROM checks.get_latest_service_status();
+
+ROLLBACK;
+"""
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=100_000_000)
+    parser.add_argument("--services", type=int, default=50)
+    args = parser.parse_args()
+
+    result = subprocess.run(
+        ["docker", "compose", "exec", "-T", "postgres", "psql",
+         "-U", os.environ.get("POSTGRES_USER", "ogna_user"),
+         "-d", os.environ.get("POSTGRES_DB", "ogna_db"),
+         "-v", "ON_ERROR_STOP=1"],
+        input=SCRIPT.format(rows=args.rows, services=args.services),
+        capture_output=True, text=True
+    )
+    if result.returncode != 0:
+        raise SystemExit(result.stderr)
+
+    timings = [float(t) for t in re.findall(r"Execution Time: ([\d.]+) ms", result.stdout)]
+    print(json.dumps({
+        "rows": args.rows,
+        "services": args.services,
+        "distinct_on_history_ms": timings[0],
+        "latest_status_ms": timings[1],
+    }, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,120 @@
+-- In-process stand-in for resty.redis with the commands jwt-blacklist uses.
+--
+-- Keys live in a Lua table with their expiry; connections always succeed
+-- unless down is set, and come back "pooled" after set_keepalive like
+-- real cosockets do.
+local _M = {
+  down = false,
+}
+
+local store = {}
+local pooled = false
+
+local redis = {}
+local mt = { __index = redis }
+
+local function expired(entry)
+  return entry.expires_at and entry.expires_at <= ngx.now()
+end
+
+local function lookup(key)
+  local entry = store[key]
+  if not entry then
+    return ngx.null
+  end
+  if expired(entry) then
+    store[key] = nil
+    return ngx.null
+  end
+  return entry.value
+end
+
+-- Commands run right away; inside a pipeline the reply is queued instead
+local function reply(self, value)
+  if self.pipeline then
+    self.pipeline[#self.pipeline + 1] = value
+    return "QUEUED"
+  end
+  return value
+end
+
+function _M.new()
+  return setmetatable({}, mt)
+end
+
+-- Forget every key and pooled connection
+function _M.reset()
+  store = {}
+  pooled = false
+  _M.down = false
+end
+
+function redis:set_timeout()
+end
+
+function redis:connect()
+  if _M.down then
+    return nil, "connection refused"
+  end
+  self.reused = pooled and 1 or 0
+  return 1
+end
+
+function redis:get_reused_times()
+  return self.reused
+end
+
+function redis:auth()
+  return "OK"
+end
+
+function redis:set_keepalive()
+  pooled = true
+  return 1
+end
+
+function redis:close()
+  return 1
+end
+
+function redis:get(key)
+  return lookup(key)
+end
+
+function redis:mget(...)
+  local res = {}
+  for i = 1, select("#", ...) do
+    res[i] = lookup(select(i, ...))
+  end
+  return res
+end
+
+function redis:setex(key, ttl, value)
+  store[key] = { value = tostring(value), expires_at = ngx.now() + ttl }
+  return reply(self, "OK")
+end
+
+-- SET key value [EX seconds]
+function redis:set(key, value, ex, ttl)
+  store[key] = {
+    value = tostring(value),
+    expires_at = ex and ex:upper() == "EX" and ngx.now() + ttl or nil,
+  }
+  return reply(self, "OK")
+end
+
+function redis:publish()
+  return reply(self, 0)
+end
+
+function redis:init_pipeline()
+  self.pipeline = {}
+end
+
+function redis:commit_pipeline()
+  local results = self.pipeline or {}
+  self.pipeline = nil
+  return results
+end
+
+return _M
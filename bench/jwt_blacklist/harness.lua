@@ -0,0 +1,368 @@
+-- Microbenchmark and test harness for JwtBlacklistHandler:access.
+--
+-- Runs the plugin under the OpenResty resty CLI with the Kong PDK mocked,
+-- against an in-process fake Redis (default) or a real one. Every path is
+-- checked for its outcome first, then timed; allocations are measured on a
+-- separate run with the garbage collector stopped.
+--
+--   resty --shdict 'jwt_blacklist 10m' --shdict 'jwt_blacklist_bloom 16m' \
+--     bench/jwt_blacklist/harness.lua [--iterations 100000] [--json]
+--     [--redis 127.0.0.1:6379 --redis-password secret]
+local ffi = require "ffi"
+local cjson = require "cjson.safe"
+
+local root = arg[0]:match("^(.*)/bench/jwt_blacklist/[^/]+$") or "."
+local here = root .. "/bench/jwt_blacklist/"
+
+local options = { iterations = 100000, json = false }
+do
+  local i = 1
+  while i <= #arg do
+    local name = arg[i]
+    if name == "--json" then
+      options.json = true
+    elseif name == "--iterations" or name == "--redis" or name == "--redis-password" then
+      i = i + 1
+      options[(name:sub(3):gsub("%-", "_"))] = arg[i]
+    else
+      error("unknown option " .. name)
+    end
+    i = i + 1
+  end
+  options.iterations = tonumber(options.iterations)
+end
+
+------------------------------------------------------------------------
+-- Module loading: plugin files from the repository, Kong stand-ins
+------------------------------------------------------------------------
+
+table.insert(package.loaders, 2, function(name)
+  local file = name:match("^kong%.plugins%.jwt%-blacklist%.(.+)$")
+  if not file then
+    return nil
+  end
+  local chunk, err = loadfile(root .. "/kong/plugins/jwt-blacklist/" .. file .. ".lua")
+  if not chunk then
+    return "\n\t" .. err
+  end
+  return chunk
+end)
+
+local function b64url_decode(s)
+  s = s:gsub("%-", "+"):gsub("_", "/")
+  if #s % 4 > 0 then
+    s = s .. string.rep("=", 4 - #s % 4)
+  end
+  return ngx.decode_base64(s)
+end
+
+local function b64url_encode(s)
+  return (ngx.encode_base64(s):gsub("%+", "-"):gsub("/", "_"):gsub("=", ""))
+end
+
+-- Decoding only, like the fields of the bundled parser the plugin reads
+package.preload["kong.plugins.jwt.jwt_parser"] = function()
+  local parser = {}
+
+  function parser:new(token)
+    local header, claims, signature = token:match("^([^.]+)%.([^.]+)%.([^.]+)$")
+    if not header then
+      return nil, "invalid JWT"
+    end
+    claims = cjson.decode(b64url_decode(claims) or "")
+    if type(claims) ~= "table" then
+      return nil, "invalid JWT claims"
+    end
+    return {
+      header = cjson.decode(b64url_decode(header) or ""),
+      claims = claims,
+      signature = b64url_decode(signature),
+    }
+  end
+
+  return parser
+end
+
+package.preload["kong.db.schema.typedefs"] = function()
+  return {
+    host = function(field) return { type = "string", default = field.default } end,
+    port = function(field) return { type = "integer", default = field.default } end,
+  }
+end
+
+local fake_redis = dofile(here .. "fake_redis.lua")
+if not options.redis then
+  package.loaded["resty.redis"] = fake_redis
+end
+
+------------------------------------------------------------------------
+-- Kong PDK
+------------------------------------------------------------------------
+
+local request = {}
+local exit_status
+
+local function noop()
+end
+
+local noop_span = {
+  set_attribute = noop,
+  set_status = noop,
+  record_error = noop,
+  finish = noop,
+}
+
+_G.kong = {
+  request = {
+    get_path = function() return request.path end,
+    get_method = function() return request.method end,
+    get_header = function(name) return request.headers[name] end,
+    get_query_arg = function(name) return request.query[name] end,
+  },
+  response = {
+    exit = function(status)
+      exit_status = status
+      return status
+    end,
+  },
+  service = {
+    request = { set_header = noop, clear_header = noop },
+  },
+  log = { err = noop, warn = noop, notice = noop, info = noop, debug = noop },
+  -- Tracing off, as for requests that are not sampled
+  tracing = {
+    start_span = function()
+      return noop_span
+    end,
+  },
+  ctx = { shared = {}, plugin = {} },
+}
+
+-- The invalidation subscriber is a background loop, not part of the hot path
+ngx.timer.at = function()
+  return true
+end
+
+local handler = require "kong.plugins.jwt-blacklist.handler"
+local connection = require "kong.plugins.jwt-blacklist.connection"
+local schema = require "kong.plugins.jwt-blacklist.schema"
+
+-- Plugin config from the schema defaults
+local function make_conf(overrides)
+  local conf = {}
+  for _, field in ipairs(schema.fields[1].config.fields) do
+    local name, def = next(field)
+    conf[name] = def.default
+  end
+
+  if options.redis then
+    local host, port = options.redis:match("^(.+):(%d+)$")
+    conf.redis_host, conf.redis_port = host, tonumber(port)
+    conf.redis_password = options.redis_password
+  else
+    -- The fake accepts any password, this keeps the secret file out of it
+    conf.redis_password = "bench"
+  end
+
+  for name, value in pairs(overrides or {}) do
+    conf[name] = value
+  end
+  return conf
+end
+
+local function make_token()
+  local now = ngx.time()
+  local claims = {
+    sub = "00000000-0000-4000-8000-" .. string.format("%012d", math.random(1, 1e9)),
+    role = "authenticated",
+    iat = now,
+    exp = now + 3600,
+  }
+  return b64url_encode('{"alg":"HS256","typ":"JWT"}') .. "." ..
+         b64url_encode(cjson.encode(claims)) .. "." ..
+         b64url_encode(ngx.md5_bin(tostring(math.random())) .. ngx.md5_bin(tostring(math.random())))
+end
+
+-- Tokens count as verified by the bundled jwt plugin unless unverified is set
+local function set_request(path, token, unverified)
+  request.path = path
+  request.method = "GET"
+  request.headers = token and { Authorization = "Bearer " .. token } or {}
+  request.query = {}
+  kong.ctx.shared.authenticated_jwt_token = not unverified and token or nil
+end
+
+------------------------------------------------------------------------
+-- Paths
+------------------------------------------------------------------------
+
+local paths = {
+  {
+    name = "no header",
+    setup = function()
+      set_request("/api/v1/health/")
+      return make_conf()
+    end,
+  },
+  {
+    name = "valid token (cached verdict)",
+    setup = function()
+      set_request("/api/v1/health/", make_token())
+      return make_conf()
+    end,
+  },
+  {
+    -- Parsed on every call, the difference to the above is the parse cache
+    name = "valid token (unverified)",
+    setup = function()
+      set_request("/api/v1/health/", make_token(), true)
+      return make_conf()
+    end,
+  },
+  {
+    name = "valid token (Redis lookup)",
+    setup = function()
+      set_request("/api/v1/health/", make_token())
+      return make_conf({ cache_enabled = false })
+    end,
+  },
+  {
+    name = "revoked token (cached verdict)",
+    expect = 401,
+    setup = function()
+      local token = make_token()
+      set_request("/auth/logout", token)
+      local conf = make_conf()
+      handler:access(conf)
+      set_request("/api/v1/health/", token)
+      return conf
+    end,
+  },
+  {
+    name = "revoked token (Redis lookup)",
+    expect = 401,
+    setup = function()
+      local token = make_token()
+      local conf = make_conf({ cache_enabled = false })
+      set_request("/auth/logout", token)
+      handler:access(conf)
+      set_request("/api/v1/health/", token)
+      return conf
+    end,
+  },
+  {
+    name = "logout write",
+    setup = function()
+      set_request("/auth/logout", make_token())
+      return make_conf()
+    end,
+  },
+  {
+    name = "Redis down (fail open)",
+    setup = function()
+      set_request("/api/v1/health/", make_token())
+      if options.redis then
+        -- Nothing listens there
+        return make_conf({ cache_enabled = false, redis_host = "127.0.0.1", redis_port = 1 })
+      end
+      fake_redis.down = true
+      return make_conf({ cache_enabled = false })
+    end,
+    teardown = function()
+      fake_redis.down = false
+    end,
+  },
+}
+
+------------------------------------------------------------------------
+-- Measurement
+------------------------------------------------------------------------
+
+ffi.cdef [[
+  typedef struct { long tv_sec; long tv_nsec; } harness_timespec;
+  int clock_gettime(int clk_id, harness_timespec *tp);
+]]
+
+local CLOCK_MONOTONIC = 1
+local ts = ffi.new("harness_timespec")
+
+local function now_ns()
+  ffi.C.clock_gettime(CLOCK_MONOTONIC, ts)
+  return tonumber(ts.tv_sec) * 1e9 + tonumber(ts.tv_nsec)
+end
+
+local function run(conf)
+  exit_status = nil
+  handler:access(conf)
+  return exit_status
+end
+
+local function measure(path)
+  local conf = path.setup()
+  local iterations = options.iterations
+
+  local status = run(conf)
+  if status ~= path.expect then
+    error(string.format("%s: expected exit %s, got %s", path.name, tostring(path.expect), tostring(status)))
+  end
+
+  for _ = 1, math.min(iterations, 1000) do
+    run(conf)
+  end
+
+  local start = now_ns()
+  for _ = 1, iterations do
+    run(conf)
+  end
+  local elapsed = now_ns() - start
+
+  -- Allocations per call, without the collector reclaiming in between
+  local alloc_iterations = math.min(iterations, 10000)
+  collectgarbage("collect")
+  collectgarbage("stop")
+  local before = collectgarbage("count")
+  for _ = 1, alloc_iterations do
+    run(conf)
+  end
+  local allocated = (collectgarbage("count") - before) * 1024
+  collectgarbage("restart")
+
+  if path.teardown then
+    path.teardown()
+  end
+
+  return {
+    path = path.name,
+    ns_per_call = math.floor(elapsed / iterations + 0.5),
+    bytes_per_call = math.floor(allocated / alloc_iterations + 0.5),
+  }
+end
+
+math.randomseed(ngx.now() * 1000)
+
+-- Fail early with a clear message when the real Redis is unreachable
+if options.redis then
+  local red, err = connection.connect(make_conf())
+  if not red then
+    error("cannot reach Redis at " .. options.redis .. ": " .. tostring(err))
+  end
+  connection.release(make_conf(), red)
+end
+
+local results = {}
+for _, path in ipairs(paths) do
+  results[#results + 1] = measure(path)
+end
+
+if options.json then
+  print(cjson.encode({
+    iterations = options.iterations,
+    redis = options.redis or "fake",
+    results = results,
+  }))
+else
+  print(string.format("%-34s %12s %14s", "path", "ns/call", "bytes/call"))
+  for _, r in ipairs(results) do
+    print(string.format("%-34s %12d %14d", r.path, r.ns_per_call, r.bytes_per_call))
+  end
+end
@@ -0,0 +1,319 @@
+"""Async load generator for the gateway routes.
+
+Runs each scenario for --duration seconds with --concurrency concurrent
+workers against the compose stack (RustFS as the local S3) and reports
+requests per second and p50/p95/p99 latency per route. Only responses
+with the expected status count towards those, the others are reported as
+errors. Kong's rate limits are lifted for the run through the Admin API
+(--keep-rate-limits measures with them) and restored at the end. Results
+can be written as JSON and compared with an earlier run.
+
+    python bench/loadgen.py --concurrency 50 --duration 20 --output results.json
+    python bench/loadgen.py --scenarios api_health bucket_listing --compare results.json
+
+Scenarios:
+    signup_token     sign up a new user and get a token
+    api_health       authenticated GET /api/v1/health/
+    revoked_token    GET /api/v1/health/ with a logged out token, 401 expected
+    bucket_listing   GET /storage/v1/buckets/<bucket>
+    upload           multipart upload of every --sizes size
+    download         download of every --sizes size
+"""
+import argparse
+import asyncio
+import copy
+import json
+import os
+import pathlib
+import platform
+import time
+import uuid
+
+import aiohttp
+import requests
+import yaml
+
+ROOT = pathlib.Path(__file__).resolve().parent.parent
+
+UNITS = {"K": 1024, "M": 1024 ** 2, "G": 1024 ** 3}
+
+SCENARIOS = ["signup_token", "api_health", "revoked_token", "bucket_listing", "upload", "download"]
+
+
+def parse_size(text):
+    unit = text[-1].upper()
+    if unit in UNITS:
+        return int(float(text[:-1]) * UNITS[unit])
+    return int(text)
+
+
+def percentile(sorted_values, fraction):
+    # Nearest rank
+    if not sorted_values:
+        return None
+    index = max(int(round(fraction * len(sorted_values))) - 1, 0)
+    return sorted_values[min(index, len(sorted_values) - 1)]
+
+
+class Recorder:
+    """Latencies and unexpected statuses per route."""
+
+    def __init__(self):
+        self.latencies = {}
+        self.errors = {}
+
+    def add(self, route, elapsed, ok):
+        # A fast 429 or 500 would flatter both throughput and latency
+        values = self.latencies.setdefault(route, [])
+        if ok:
+            values.append(elapsed * 1000)
+        else:
+            self.errors[route] = self.errors.get(route, 0) + 1
+
+    def report(self, duration):
+        report = {}
+        for route, values in self.latencies.items():
+            values.sort()
+            quantiles = {key: percentile(values, fraction)
+                         for key, fraction in (("p50_ms", 0.50), ("p95_ms", 0.95), ("p99_ms", 0.99))}
+            report[route] = {
+                "requests": len(values),
+                "errors": self.errors.get(route, 0),
+                "rps": round(len(values) / duration, 1),
+                **{key: round(value, 2) if value is not None else None for key, value in quantiles.items()},
+            }
+        return report
+
+
+class Stack:
+    """Users, buckets and files the scenarios share."""
+
+    def __init__(self, session, base_url):
+        self.session = session
+        self.base_url = base_url
+        self.buckets_url = f"{base_url}/storage/v1/buckets"
+
+    async def timed(self, recorder, route, method, url, expected, **kwargs):
+        start = time.perf_counter()
+        try:
+            async with self.session.request(method, url, **kwargs) as response:
+                body = await response.read()
+                ok = response.status in expected
+        except aiohttp.ClientError:
+            body, ok = None, False
+        recorder.add(route, time.perf_counter() - start, ok)
+        return ok, body
+
+    async def sign_up(self, recorder=None):
+        payload = {"email": f"{uuid.uuid4()}@example.com", "password": "strongpassword"}
+        recorder = recorder or Recorder()
+        await self.timed(recorder, "POST /auth/signup", "POST", f"{self.base_url}/auth/signup",
+                         (200,), json=payload)
+        ok, body = await self.timed(recorder, "POST /auth/token", "POST",
+                                    f"{self.base_url}/auth/token?grant_type=password", (200,), json=payload)
+        return json.loads(body)["access_token"] if ok else None
+
+    async def create_bucket(self, token):
+        name = f"loadgen-{uuid.uuid4()}"
+        async with self.session.post(self.buckets_url, json={"name": name, "public": False},
+                                     headers=auth(token)) as response:
+            response.raise_for_status()
+        return name
+
+    async def upload(self, recorder, route, token, bucket, file_name, payload):
+        form = aiohttp.FormData()
+        form.add_field("file", payload, filename=file_name, content_type="application/octet-stream")
+        return await self.timed(recorder, route, "POST", f"{self.buckets_url}/{bucket}",
+                                (201,), data=form, headers=auth(token))
+
+
+def auth(token):
+    return {"Authorization": f"Bearer {token}"}
+
+
+async def run_workers(concurrency, duration, step):
+    deadline = time.perf_counter() + duration
+
+    async def worker(index):
+        iteration = 0
+        while time.perf_counter() < deadline:
+            await step(index, iteration)
+            iteration += 1
+
+    await asyncio.gather(*(worker(i) for i in range(concurrency)))
+
+
+async def scenario_signup_token(stack, args, recorder):
+    async def step(index, iteration):
+        await stack.sign_up(recorder)
+
+    await run_workers(args.concurrency, args.duration, step)
+
+
+async def scenario_api_health(stack, args, recorder):
+    tokens = [await stack.sign_up() for _ in range(args.users)]
+    url = f"{stack.base_url}/api/v1/health/"
+
+    async def step(index, iteration):
+        await stack.timed(recorder, "GET /api/v1/health/", "GET", url, (200,),
+                          headers=auth(tokens[index % len(tokens)]))
+
+    await run_workers(args.concurrency, args.duration, step)
+
+
+async def scenario_revoked_token(stack, args, recorder):
+    tokens = [await stack.sign_up() for _ in range(args.users)]
+    for token in tokens:
+        async with stack.session.post(f"{stack.base_url}/auth/logout", headers=auth(token)):
+            pass
+    url = f"{stack.base_url}/api/v1/health/"
+
+    async def step(index, iteration):
+        await stack.timed(recorder, "GET /api/v1/health/ (revoked)", "GET", url, (401,),
+                          headers=auth(tokens[index % len(tokens)]))
+
+    await run_workers(args.concurrency, args.duration, step)
+
+
+async def scenario_bucket_listing(stack, args, recorder):
+    token = await stack.sign_up()
+    bucket = await stack.create_bucket(token)
+    for i in range(args.listing_files):
+        await stack.upload(Recorder(), "setup", token, bucket, f"file-{i}.txt", b"listing entry")
+    url = f"{stack.buckets_url}/{bucket}"
+
+    async def step(index, iteration):
+        await stack.timed(recorder, "GET /storage/v1/buckets/<bucket>", "GET", url, (200,),
+                          headers=auth(token))
+
+    await run_workers(args.concurrency, args.duration, step)
+
+
+async def scenario_upload(stack, args, recorder):
+    token = await stack.sign_up()
+    bucket = await stack.create_bucket(token)
+
+    for text in args.sizes:
+        payload = os.urandom(parse_size(text))
+
+        async def step(index, iteration, text=text, payload=payload):
+            await stack.upload(recorder, f"POST /storage/v1/buckets/<bucket> ({text})", token, bucket,
+                               f"upload-{text}-{index}-{iteration}.bin", payload)
+
+        await run_workers(args.concurrency, args.duration, step)
+
+
+async def scenario_download(stack, args, recorder):
+    token = await stack.sign_up()
+    bucket = await stack.create_bucket(token)
+
+    for text in args.sizes:
+        file_name = f"download-{text}.bin"
+        ok, body = await stack.upload(Recorder(), "setup", token, bucket, file_name, os.urandom(parse_size(text)))
+        if not ok:
+            raise SystemExit(f"could not upload the {text} download fixture: {body}")
+        url = f"{stack.buckets_url}/{bucket}/{file_name}"
+
+        async def step(index, iteration, text=text, url=url):
+            await stack.timed(recorder, f"GET /storage/v1/buckets/<bucket>/<file> ({text})", "GET", url,
+                              (200,), headers=auth(token))
+
+        await run_workers(args.concurrency, args.duration, step)
+
+
+def without_rate_limits(declarative):
+    config = copy.deepcopy(declarative)
+    for service in config["services"]:
+        service["plugins"] = [p for p in service.get("plugins", []) if "rate-limiting" not in p["name"]]
+    return config
+
+
+def compare(results, baseline):
+    """Relative change of rps and p99 per route against an earlier run."""
+    changes = {}
+    for route, current in results["routes"].items():
+        previous = baseline.get("routes", {}).get(route)
+        if not previous:
+            continue
+        changes[route] = {
+            "rps_change": f"{(current['rps'] / previous['rps'] - 1) * 100:+.1f}%" if previous["rps"] else None,
+            "p99_change": f"{(current['p99_ms'] / previous['p99_ms'] - 1) * 100:+.1f}%"
+            if previous["p99_ms"] and current["p99_ms"] else None,
+        }
+    return changes
+
+
+async def main_async(args):
+    timeout = aiohttp.ClientTimeout(total=args.timeout)
+    connector = aiohttp.TCPConnector(limit=args.concurrency * 2)
+    routes = {}
+
+    async with aiohttp.ClientSession(timeout=timeout, connector=connector) as session:
+        stack = Stack(session, args.base_url)
+        for name in args.scenarios:
+            recorder = Recorder()
+            start = time.perf_counter()
+            await globals()[f"scenario_{name}"](stack, args, recorder)
+            report = recorder.report(args.duration)
+            for route, stats in report.items():
+                print(f"{name:>15}  {route:<55} {stats['rps']:>9} rps  "
+                      f"p50 {stats['p50_ms']:>8} ms  p95 {stats['p95_ms']:>8} ms  "
+                      f"p99 {stats['p99_ms']:>8} ms  errors {stats['errors']}")
+            routes.update(report)
+            print(f"{name:>15}  finished in {time.perf_counter() - start:.1f} s")
+
+    return {
+        "started_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        "host": platform.node(),
+        "settings": {
+            "base_url": args.base_url,
+            "concurrency": args.concurrency,
+            "duration": args.duration,
+            "users": args.users,
+            "sizes": args.sizes,
+            "rate_limits": args.keep_rate_limits,
+        },
+        "routes": routes,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--base-url", default="http://localhost:8000")
+    parser.add_argument("--admin-url", default="http://localhost:8001")
+    parser.add_argument("--keep-rate-limits", action="store_true",
+                        help="leave Kong's rate limits on, runs above them mostly measure 429s")
+    parser.add_argument("--scenarios", nargs="+", choices=SCENARIOS, default=SCENARIOS)
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--duration", type=float, default=20)
+    parser.add_argument("--users", type=int, default=20)
+    parser.add_argument("--sizes", nargs="+", default=["1K", "100K", "1M", "10M"])
+    parser.add_argument("--listing-files", type=int, default=100)
+    parser.add_argument("--timeout", type=float, default=120)
+    parser.add_argument("--output", help="write the results as JSON to this file")
+    parser.add_argument("--compare", help="JSON results of an earlier run to compare with")
+    args = parser.parse_args()
+
+    if args.keep_rate_limits:
+        results = asyncio.run(main_async(args))
+    else:
+        declarative = yaml.safe_load((ROOT / "kong" / "kong.yaml").read_text())
+        requests.post(f"{args.admin_url}/config", json=without_rate_limits(declarative)).raise_for_status()
+        try:
+            time.sleep(1)
+            results = asyncio.run(main_async(args))
+        finally:
+            requests.post(f"{args.admin_url}/config", json=declarative)
+
+    if args.compare:
+        with open(args.compare) as f:
+            results["comparison"] = compare(results, json.load(f))
+        print(json.dumps(results["comparison"], indent=2))
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,126 @@
+"""Added gateway latency of the rate limiting policies on /api.
+
+Pushes a variant of kong/kong.yaml to the Admin API for every policy,
+fires authenticated requests at /api/v1/health/ and reports latency
+percentiles against a run without rate limiting. The original
+configuration is restored at the end.
+
+    python bench/rate_limiting.py --requests 2000 --concurrency 16
+"""
+import argparse
+import copy
+import json
+import pathlib
+import statistics
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+import yaml
+
+ROOT = pathlib.Path(__file__).resolve().parent.parent
+
+# Limits high enough that no request of the run is rejected
+LIMITS = {"second": 1000000, "minute": 10000000}
+
+
+def variants(redis_password):
+    return {
+        "none": None,
+        "local": {"name": "rate-limiting", "config": {**LIMITS, "policy": "local"}},
+        "redis": {
+            "name": "rate-limiting",
+            "config": {
+                **LIMITS,
+                "policy": "redis",
+                "redis": {"host": "redis", "port": 6379, "password": redis_password},
+            },
+        },
+        "cluster": {
+            "name": "cluster-rate-limiting",
+            "config": {**LIMITS, "limit_by": "sub", "redis_host": "redis", "redis_port": 6379},
+        },
+    }
+
+
+def with_policy(declarative, plugin):
+    config = copy.deepcopy(declarative)
+    for service in config["services"]:
+        if service["name"] != "api-service":
+            continue
+        plugins = [p for p in service.get("plugins", []) if "rate-limiting" not in p["name"]]
+        if plugin:
+            plugins.append(plugin)
+        service["plugins"] = plugins
+    return config
+
+
+def sign_in(base_url):
+    payload = {"email": f"{uuid.uuid4()}@example.com", "password": "strongpassword"}
+    requests.post(f"{base_url}/auth/signup", json=payload).raise_for_status()
+    response = requests.post(f"{base_url}/auth/token?grant_type=password", json=payload)
+    response.raise_for_status()
+    return response.json()["access_token"]
+
+
+def run(url, token, total, concurrency):
+    session = requests.session()
+    session.headers.update({"Authorization": f"Bearer {token}"})
+
+    def call(_):
+        start = time.perf_counter()
+        response = session.get(url)
+        elapsed = (time.perf_counter() - start) * 1000
+        return elapsed, response.status_code
+
+    # Warm up connection pools and caches
+    for _ in range(50):
+        call(None)
+
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        results = list(pool.map(call, range(total)))
+
+    latencies = sorted(r[0] for r in results)
+    errors = sum(1 for r in results if r[1] != 200)
+    quantiles = statistics.quantiles(latencies, n=100)
+    return {
+        "p50": quantiles[49],
+        "p95": quantiles[94],
+        "p99": quantiles[98],
+        "errors": errors,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--base-url", default="http://localhost:8000")
+    parser.add_argument("--admin-url", default="http://localhost:8001")
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=16)
+    args = parser.parse_args()
+
+    declarative = yaml.safe_load((ROOT / "kong" / "kong.yaml").read_text())
+    redis_password = (ROOT / "secrets" / "redis_password.txt").read_text().strip()
+    token = sign_in(args.base_url)
+
+    results = {}
+    try:
+        for name, plugin in variants(redis_password).items():
+            response = requests.post(f"{args.admin_url}/config", json=with_policy(declarative, plugin))
+            response.raise_for_status()
+            time.sleep(1)
+            results[name] = run(f"{args.base_url}/api/v1/health/", token, args.requests, args.concurrency)
+    finally:
+        requests.post(f"{args.admin_url}/config", json=declarative)
+
+    baseline = results["none"]
+    print(f"{'policy':<10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'+p50 ms':>10}{'errors':>8}")
+    for name, r in results.items():
+        print(f"{name:<10}{r['p50']:>10.2f}{r['p95']:>10.2f}{r['p99']:>10.2f}"
+              f"{r['p50'] - baseline['p50']:>10.2f}{r['errors']:>8}")
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
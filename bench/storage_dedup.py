@@ -0,0 +1,97 @@
+"""Space saved and write throughput of deduplicated storage uploads.
+
+Uploads a duplicate-heavy workload through Kong: every file is drawn from a
+small pool of distinct payloads, spread over several buckets. Reports
+uploads/s and MB/s, then reads `storage.dedup_stats` with psql inside the
+postgres container to show logical, stored and saved bytes.
+
+    python bench/storage_dedup.py --files 1000 --distinct 50 --size 256K
+"""
+import argparse
+import io
+import json
+import os
+import subprocess
+import time
+import uuid
+
+import requests
+
+UNITS = {"K": 1024, "M": 1024 ** 2, "G": 1024 ** 3}
+
+
+def parse_size(text):
+    unit = text[-1].upper()
+    if unit in UNITS:
+        return int(float(text[:-1]) * UNITS[unit])
+    return int(text)
+
+
+def sign_in(base_url):
+    payload = {"email": f"{uuid.uuid4()}@example.com", "password": "strongpassword"}
+    requests.post(f"{base_url}/auth/signup", json=payload).raise_for_status()
+    response = requests.post(f"{base_url}/auth/token?grant_type=password", json=payload)
+    response.raise_for_status()
+    return response.json()["access_token"]
+
+
+def dedup_stats():
+    query = "SELECT row_to_json(s) FROM storage.dedup_stats s"
+    result = subprocess.run(
+        ["docker", "compose", "exec", "-T", "postgres", "psql",
+         "-U", os.environ.get("POSTGRES_USER", "ogna_user"),
+         "-d", os.environ.get("POSTGRES_DB", "ogna_db"),
+         "-At", "-c", query],
+        capture_output=True, text=True
+    )
+    if result.returncode != 0:
+        return {"error": result.stderr.strip()}
+    return json.loads(result.stdout)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--base-url", default="http://localhost:8000")
+    parser.add_argument("--files", type=int, default=1000)
+    parser.add_argument("--distinct", type=int, default=50)
+    parser.add_argument("--buckets", type=int, default=4)
+    parser.add_argument("--size", default="256K")
+    args = parser.parse_args()
+
+    size = parse_size(args.size)
+    token = sign_in(args.base_url)
+    session = requests.Session()
+    session.headers["Authorization"] = f"Bearer {token}"
+    buckets = f"{args.base_url}/storage/v1/buckets"
+
+    bucket_names = [f"bench-bucket-{uuid.uuid4()}" for _ in range(args.buckets)]
+    for name in bucket_names:
+        session.post(buckets, json={"name": name, "public": False}).raise_for_status()
+
+    payloads = [os.urandom(size) for _ in range(args.distinct)]
+    before = dedup_stats()
+
+    failures = 0
+    start = time.perf_counter()
+    for i in range(args.files):
+        files = {"file": (f"file-{i}.bin", io.BytesIO(payloads[i % args.distinct]), "application/octet-stream")}
+        response = session.post(f"{buckets}/{bucket_names[i % args.buckets]}", files=files)
+        if response.status_code != 201:
+            failures += 1
+    elapsed = time.perf_counter() - start
+
+    print(json.dumps({
+        "files": args.files,
+        "distinct": args.distinct,
+        "size": args.size,
+        "failures": failures,
+        "seconds": round(elapsed, 3),
+        "uploads_per_s": round(args.files / elapsed, 1),
+        "mb_per_s": round(args.files * size / elapsed / UNITS["M"], 2),
+        "dedup_before": before,
+        "dedup_after": dedup_stats(),
+    }, indent=2))
+
+
+if __name__ == "__main__":
+    main()
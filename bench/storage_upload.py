@@ -0,0 +1,129 @@
+"""Upload throughput and peak memory of the storage path.
+
+Streams multipart uploads of several sizes through Kong to the storage
+service without holding the file in memory on the client, while
+sampling `docker stats` for the Kong and storage containers. Reports
+MB/s per size and the peak RSS seen during each upload.
+
+    python bench/storage_upload.py --sizes 1M 100M 5G
+"""
+import argparse
+import json
+import os
+import subprocess
+import threading
+import time
+import uuid
+
+import requests
+
+CHUNK = 1024 * 1024
+UNITS = {"K": 1024, "M": 1024 ** 2, "G": 1024 ** 3}
+
+
+def parse_size(text):
+    unit = text[-1].upper()
+    if unit in UNITS:
+        return int(float(text[:-1]) * UNITS[unit])
+    return int(text)
+
+
+def parse_mem(text):
+    # docker stats prints e.g. "123.4MiB / 7.6GiB"
+    value = text.split("/")[0].strip()
+    for suffix, factor in (("GiB", 1024 ** 3), ("MiB", 1024 ** 2), ("KiB", 1024), ("B", 1)):
+        if value.endswith(suffix):
+            return float(value[:-len(suffix)]) * factor
+    return 0.0
+
+
+class MemorySampler(threading.Thread):
+    """Polls `docker stats` and keeps the peak memory per container."""
+
+    def __init__(self, containers):
+        super().__init__(daemon=True)
+        self.containers = containers
+        self.peaks = {}
+        self.running = True
+
+    def run(self):
+        while self.running:
+            result = subprocess.run(
+                ["docker", "stats", "--no-stream", "--format", "{{.Name}}\t{{.MemUsage}}"],
+                capture_output=True, text=True
+            )
+            for line in result.stdout.splitlines():
+                name, usage = line.split("\t")
+                if any(c in name for c in self.containers):
+                    self.peaks[name] = max(self.peaks.get(name, 0), parse_mem(usage))
+
+    def stop(self):
+        self.running = False
+        self.join()
+
+
+def multipart_stream(boundary, file_name, size):
+    yield (f"--{boundary}\r\n"
+           f'Content-Disposition: form-data; name="file"; filename="{file_name}"\r\n'
+           "Content-Type: application/octet-stream\r\n\r\n").encode()
+    block = os.urandom(CHUNK)
+    sent = 0
+    while sent < size:
+        part = block[:min(CHUNK, size - sent)]
+        sent += len(part)
+        yield part
+    yield f"\r\n--{boundary}--\r\n".encode()
+
+
+def sign_in(base_url):
+    payload = {"email": f"{uuid.uuid4()}@example.com", "password": "strongpassword"}
+    requests.post(f"{base_url}/auth/signup", json=payload).raise_for_status()
+    response = requests.post(f"{base_url}/auth/token?grant_type=password", json=payload)
+    response.raise_for_status()
+    return response.json()["access_token"]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--base-url", default="http://localhost:8000")
+    parser.add_argument("--sizes", nargs="+", default=["1M", "100M", "5G"])
+    parser.add_argument("--containers", nargs="+", default=["kong", "storage"])
+    args = parser.parse_args()
+
+    token = sign_in(args.base_url)
+    headers = {"Authorization": f"Bearer {token}"}
+    buckets = f"{args.base_url}/storage/v1/buckets"
+
+    bucket_name = f"bench-bucket-{uuid.uuid4()}"
+    requests.post(buckets, json={"name": bucket_name, "public": False}, headers=headers).raise_for_status()
+
+    results = []
+    for text in args.sizes:
+        size = parse_size(text)
+        boundary = uuid.uuid4().hex
+        sampler = MemorySampler(args.containers)
+        sampler.start()
+
+        start = time.perf_counter()
+        response = requests.post(
+            f"{buckets}/{bucket_name}",
+            data=multipart_stream(boundary, f"upload-{text}.bin", size),
+            headers={**headers, "Content-Type": f"multipart/form-data; boundary={boundary}"},
+        )
+        elapsed = time.perf_counter() - start
+        sampler.stop()
+
+        results.append({
+            "size": text,
+            "status": response.status_code,
+            "seconds": round(elapsed, 3),
+            "mb_per_s": round(size / elapsed / UNITS["M"], 2),
+            "peak_rss_mb": {name: round(peak / UNITS["M"], 1) for name, peak in sampler.peaks.items()},
+        })
+        print(json.dumps(results[-1]))
+
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
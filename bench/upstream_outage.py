@@ -0,0 +1,95 @@
+"""Latency through Kong while the API upstream is down.
+
+Sends a steady stream of authenticated /api/v1/health/ requests from
+several threads. After --warmup seconds the api container is paused with
+`docker compose pause` (a stalled upstream: connections hang instead of
+being refused), and unpaused after --outage seconds. Reports p50/p99 and
+status counts before, during and after the outage; with health checks the
+p99 during the outage stays around the probe interval instead of reaching
+the read timeout.
+
+    python bench/upstream_outage.py --warmup 10 --outage 20 --recovery 15
+"""
+import argparse
+import json
+import statistics
+import subprocess
+import threading
+import time
+import uuid
+from collections import Counter
+
+import requests
+
+
+def sign_in(base_url):
+    payload = {"email": f"{uuid.uuid4()}@example.com", "password": "strongpassword"}
+    requests.post(f"{base_url}/auth/signup", json=payload).raise_for_status()
+    response = requests.post(f"{base_url}/auth/token?grant_type=password", json=payload)
+    response.raise_for_status()
+    return response.json()["access_token"]
+
+
+def summarize(samples):
+    if not samples:
+        return {}
+    latencies = sorted(latency for latency, _ in samples)
+    return {
+        "requests": len(samples),
+        "p50_ms": round(statistics.median(latencies), 1),
+        "p99_ms": round(latencies[max(int(len(latencies) * 0.99) - 1, 0)], 1),
+        "statuses": dict(Counter(str(status) for _, status in samples)),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--base-url", default="http://localhost:8000")
+    parser.add_argument("--service", default="api")
+    parser.add_argument("--threads", type=int, default=8)
+    parser.add_argument("--warmup", type=float, default=10)
+    parser.add_argument("--outage", type=float, default=20)
+    parser.add_argument("--recovery", type=float, default=15)
+    parser.add_argument("--timeout", type=float, default=30)
+    args = parser.parse_args()
+
+    url = f"{args.base_url}/api/v1/health/"
+    headers = {"Authorization": f"Bearer {sign_in(args.base_url)}"}
+    phases = {"before": [], "during": [], "after": []}
+    phase = "before"
+    running = True
+
+    def worker():
+        session = requests.Session()
+        while running:
+            current = phase
+            start = time.perf_counter()
+            try:
+                status = session.get(url, headers=headers, timeout=args.timeout).status_code
+            except requests.RequestException:
+                status = "error"
+            phases[current].append(((time.perf_counter() - start) * 1000, status))
+
+    threads = [threading.Thread(target=worker, daemon=True) for _ in range(args.threads)]
+    for thread in threads:
+        thread.start()
+
+    time.sleep(args.warmup)
+    subprocess.run(["docker", "compose", "pause", args.service], check=True)
+    phase = "during"
+    try:
+        time.sleep(args.outage)
+    finally:
+        subprocess.run(["docker", "compose", "unpause", args.service], check=True)
+    phase = "after"
+    time.sleep(args.recovery)
+
+    running = False
+    for thread in threads:
+        thread.join()
+
+    print(json.dumps({name: summarize(samples) for name, samples in phases.items()}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
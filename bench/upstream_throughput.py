@@ -0,0 +1,82 @@
+"""Throughput through Kong's upstreams with one or several replicas.
+
+Runs --concurrency threads for --duration seconds against an API and a
+storage endpoint, spreading requests over --users users so consistent
+hashing on the user has something to spread. Run it once against the
+plain stack and once with docker-compose-scale.yaml to compare.
+
+    python bench/upstream_throughput.py --concurrency 64 --duration 30
+"""
+import argparse
+import json
+import statistics
+import threading
+import time
+import uuid
+from collections import Counter
+
+import requests
+
+
+def sign_in(base_url):
+    payload = {"email": f"{uuid.uuid4()}@example.com", "password": "strongpassword"}
+    requests.post(f"{base_url}/auth/signup", json=payload).raise_for_status()
+    response = requests.post(f"{base_url}/auth/token?grant_type=password", json=payload)
+    response.raise_for_status()
+    return response.json()["access_token"]
+
+
+def run(url, tokens, concurrency, duration):
+    samples = []
+    lock = threading.Lock()
+    deadline = time.perf_counter() + duration
+
+    def worker(index):
+        session = requests.Session()
+        session.headers["Authorization"] = f"Bearer {tokens[index % len(tokens)]}"
+        local = []
+        while time.perf_counter() < deadline:
+            start = time.perf_counter()
+            try:
+                status = session.get(url, timeout=30).status_code
+            except requests.RequestException:
+                status = "error"
+            local.append(((time.perf_counter() - start) * 1000, status))
+        with lock:
+            samples.extend(local)
+
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    latencies = sorted(latency for latency, _ in samples)
+    return {
+        "requests": len(samples),
+        "rps": round(len(samples) / duration, 1),
+        "p50_ms": round(statistics.median(latencies), 1),
+        "p99_ms": round(latencies[int(len(latencies) * 0.99) - 1], 1),
+        "statuses": dict(Counter(str(status) for _, status in samples)),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--base-url", default="http://localhost:8000")
+    parser.add_argument("--users", type=int, default=16)
+    parser.add_argument("--concurrency", type=int, default=64)
+    parser.add_argument("--duration", type=float, default=30)
+    args = parser.parse_args()
+
+    tokens = [sign_in(args.base_url) for _ in range(args.users)]
+    endpoints = {
+        "api": f"{args.base_url}/api/v1/health/",
+        "storage": f"{args.base_url}/storage/v1/buckets",
+    }
+    results = {name: run(url, tokens, args.concurrency, args.duration) for name, url in endpoints.items()}
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
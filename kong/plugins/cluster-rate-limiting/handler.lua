@@ -0,0 +1,197 @@
+local tokens = require "kong.plugins.jwt-blacklist.tokens"
+local connection = require "kong.plugins.jwt-blacklist.connection"
+
+-- Cluster-wide rate limiting with batched counter sync.
+--
+-- Requests are counted in worker-local tables and flushed to Redis every
+-- sync_interval seconds with one pipelined INCRBY per window. The cluster
+-- totals Redis returns are kept in a lua_shared_dict, so the decision on the
+-- request path is local: cluster total as of the last sync plus what this
+-- worker has not flushed yet, over a sliding window weighted from the
+-- previous fixed window.
+local ClusterRateLimitingHandler = {
+  VERSION = "1.0.0",
+  PRIORITY = 910,
+}
+
+local floor, max = math.floor, math.max
+
+local PERIODS = {
+  { name = "second", size = 1, header = "Second" },
+  { name = "minute", size = 60, header = "Minute" },
+  { name = "hour", size = 3600, header = "Hour" },
+}
+
+-- Unflushed counts per plugin config: pending[conf][key] = delta
+local pending = setmetatable({}, { __mode = "k" })
+
+-- Plugin configs whose sync timer is armed in this worker
+local syncing = setmetatable({}, { __mode = "k" })
+
+-- Flush this worker's counters for one config and re-arm while there is traffic
+local function sync(premature, conf)
+  if premature then
+    return
+  end
+
+  local batch = pending[conf]
+  pending[conf] = nil
+
+  if not batch then
+    -- Idle, the next request arms the timer again
+    syncing[conf] = nil
+    return
+  end
+
+  local shm = ngx.shared[conf.shm]
+  local red, conn_err = connection.connect(conf)
+  if not red then
+    kong.log.err("Rate Limiting Sync Connection Error: ", conn_err)
+  else
+    local keys = {}
+    red:init_pipeline()
+    for key, entry in pairs(batch) do
+      keys[#keys + 1] = key
+      red:incrby("ratelimit:" .. key, entry.delta)
+      red:expire("ratelimit:" .. key, entry.ttl)
+    end
+
+    local results, err = red:commit_pipeline()
+    if results then
+      connection.release(conf, red)
+      for i, key in ipairs(keys) do
+        local total = results[2 * i - 1]
+        if type(total) == "number" and shm then
+          shm:set(key, total, batch[key].ttl)
+        end
+      end
+      batch = nil
+    else
+      red:close()
+      kong.log.err("Rate Limiting Sync Error: ", err)
+    end
+  end
+
+  -- Keep what could not be flushed for the next round
+  if batch then
+    local current = pending[conf]
+    if not current then
+      pending[conf] = batch
+    else
+      for key, entry in pairs(batch) do
+        local c = current[key]
+        if c then
+          c.delta = c.delta + entry.delta
+        else
+          current[key] = entry
+        end
+      end
+    end
+  end
+
+  local ok, timer_err = ngx.timer.at(conf.sync_interval, sync, conf)
+  if not ok then
+    syncing[conf] = nil
+    kong.log.err("Rate Limiting Sync Timer Error: ", timer_err)
+  end
+end
+
+local function get_identifier(conf)
+  if conf.limit_by == "sub" then
+    -- Set by the bundled jwt plugin once the token is verified
+    local token = kong.ctx.shared.authenticated_jwt_token
+    if token then
+      local jwt = tokens.parse(token)
+      local sub = jwt and jwt.claims and jwt.claims.sub
+      if sub then
+        return "sub:" .. sub
+      end
+    end
+  end
+
+  return "ip:" .. kong.client.get_forwarded_ip()
+end
+
+function ClusterRateLimitingHandler:access(conf)
+  local now = ngx.now()
+  local shm = ngx.shared[conf.shm]
+  local service = kong.router.get_service()
+  local prefix = (service and service.id or "global") .. ":" .. get_identifier(conf) .. ":"
+
+  local local_counts = pending[conf]
+  if not local_counts then
+    local_counts = {}
+    pending[conf] = local_counts
+  end
+
+  local headers = {}
+  local exceeded, retry_after = false, 0
+  local keys = {}
+
+  for i, period in ipairs(PERIODS) do
+    local limit = conf[period.name]
+    if limit then
+      local window = floor(now / period.size)
+      local key = prefix .. period.name .. ":" .. window
+      local prev_key = prefix .. period.name .. ":" .. (window - 1)
+
+      local current = (shm and shm:get(key) or 0)
+      local entry = local_counts[key]
+      if entry then
+        current = current + entry.delta
+      end
+
+      local previous = (shm and shm:get(prev_key) or 0)
+      local prev_entry = local_counts[prev_key]
+      if prev_entry then
+        previous = previous + prev_entry.delta
+      end
+
+      -- Sliding window: the previous window counts for the part still covered
+      local elapsed = now / period.size - window
+      local used = previous * (1 - elapsed) + current
+
+      if used + 1 > limit then
+        exceeded = true
+        retry_after = max(retry_after, (1 - elapsed) * period.size)
+      end
+
+      keys[i] = key
+      headers["X-RateLimit-Limit-" .. period.header] = limit
+      headers["X-RateLimit-Remaining-" .. period.header] = max(floor(limit - used - 1), 0)
+    end
+  end
+
+  if exceeded then
+    headers["Retry-After"] = max(floor(retry_after + 0.5), 1)
+    return kong.response.exit(429, { message = "API rate limit exceeded" }, headers)
+  end
+
+  for i, period in ipairs(PERIODS) do
+    local key = keys[i]
+    if key then
+      local entry = local_counts[key]
+      if entry then
+        entry.delta = entry.delta + 1
+      else
+        -- Windows must outlive their successor, which still weighs them in
+        local_counts[key] = { delta = 1, ttl = 2 * period.size }
+      end
+    end
+  end
+
+  if not syncing[conf] then
+    syncing[conf] = true
+    local ok, err = ngx.timer.at(conf.sync_interval, sync, conf)
+    if not ok then
+      syncing[conf] = nil
+      kong.log.err("Rate Limiting Sync Timer Error: ", err)
+    end
+  end
+
+  if not conf.hide_client_headers then
+    kong.response.set_headers(headers)
+  end
+end
+
+return ClusterRateLimitingHandler
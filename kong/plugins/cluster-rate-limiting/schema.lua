@@ -0,0 +1,31 @@
+local typedefs = require "kong.db.schema.typedefs"
+
+return {
+  name = "cluster-rate-limiting",
+  fields = {
+    { config = {
+        type = "record",
+        fields = {
+          { second = { type = "integer", gt = 0 } },
+          { minute = { type = "integer", gt = 0 } },
+          { hour = { type = "integer", gt = 0 } },
+          -- "sub" keys on the JWT subject and falls back to the client IP
+          { limit_by = { type = "string", default = "sub", one_of = { "sub", "ip" } } },
+          -- Seconds between two flushes of the local counters to Redis
+          { sync_interval = { type = "number", default = 0.5, gt = 0 } },
+          { shm = { type = "string", default = "cluster_rate_limiting" } },
+          { hide_client_headers = { type = "boolean", default = false } },
+          -- Same Redis as jwt-blacklist
+          { redis_host = typedefs.host({ default = "127.0.0.1" }) },
+          { redis_port = typedefs.port({ default = 6379 }) },
+          { redis_timeout = { type = "number", default = 1000 } },
+          { redis_pool_size = { type = "integer", default = 100, gt = 0 } },
+          { redis_backlog = { type = "integer", gt = 0 } },
+          { redis_keepalive_timeout = { type = "integer", default = 10000, gt = 0 } },
+        },
+        entity_checks = {
+          { at_least_one_of = { "second", "minute", "hour" } },
+        },
+    }, },
+  },
+}
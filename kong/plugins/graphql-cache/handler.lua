@@ -0,0 +1,287 @@
+local cjson = require "cjson.safe"
+local lyaml = require "lyaml"
+local resty_sha256 = require "resty.sha256"
+local resty_string = require "resty.string"
+local tokens = require "kong.plugins.jwt-blacklist.tokens"
+local connection = require "kong.plugins.jwt-blacklist.connection"
+
+-- Result cache and persisted queries for Hasura.
+--
+-- Queries carrying Hasura's @cached directive, and persisted queries of the
+-- cached collections, are answered from Redis. Keys are made of the role,
+-- the user and the request, so a result is only ever served to whoever the
+-- same permissions apply to. Persisted queries are sent as an Apollo style
+-- sha256 hash of a query of the Hasura query collections; Kong puts the
+-- query text back before Hasura sees the request.
+local GraphqlCacheHandler = {
+  VERSION = "1.0.0",
+  PRIORITY = 100,
+}
+
+local concat = table.concat
+local min = math.min
+
+local REDIS_PREFIX = "graphql-cache:"
+
+local PERSISTED_QUERY_NOT_FOUND = {
+  errors = {
+    {
+      message = "PersistedQueryNotFound",
+      extensions = { code = "PERSISTED_QUERY_NOT_FOUND" },
+    },
+  },
+}
+
+-- Persisted queries per collections file, loaded once per worker:
+-- collections[path] = { [hash] = { query = text, cached = boolean } }
+local collections = {}
+
+local function sha256_hex(text)
+  local sha256 = resty_sha256:new()
+  sha256:update(text)
+  return resty_string.to_hex(sha256:final())
+end
+
+local function load_collections(conf)
+  local path = conf.query_collections_path
+  local queries = collections[path]
+  if queries then
+    return queries
+  end
+
+  queries = {}
+  collections[path] = queries
+
+  local f, err = io.open(path, "r")
+  if not f then
+    kong.log.err("GraphQL Cache could not open query collections: ", err)
+    return queries
+  end
+
+  local ok, docs = pcall(lyaml.load, f:read("*all"))
+  f:close()
+  if not ok or type(docs) ~= "table" then
+    kong.log.err("GraphQL Cache could not parse query collections: ", docs)
+    return queries
+  end
+
+  local cached = {}
+  for _, name in ipairs(conf.cached_collections) do
+    cached[name] = true
+  end
+
+  for _, collection in ipairs(docs) do
+    local definition = collection.definition or {}
+    for _, entry in ipairs(definition.queries or {}) do
+      queries[sha256_hex(entry.query)] = {
+        query = entry.query,
+        cached = cached[collection.name] or false,
+      }
+    end
+  end
+
+  return queries
+end
+
+-- Seconds to cache the result for from an @cached or @cached(ttl: n) directive
+local function directive_ttl(conf, query)
+  local ttl = query:match("@cached%s*%(%s*ttl%s*:%s*(%d+)%s*%)")
+  if ttl then
+    return min(tonumber(ttl), conf.max_ttl)
+  end
+  if query:find("@cached%f[^%w_]") then
+    return conf.ttl
+  end
+end
+
+-- Hasura CE does not know the directive, it never leaves the gateway
+local function strip_directive(query)
+  query = query:gsub("@cached%s*%b()", "")
+  return (query:gsub("@cached%f[^%w_]", ""))
+end
+
+-- A document may hold several operations behind comments or a leading
+-- query, so any mutation or subscription keyword makes it uncacheable; a
+-- field of that name only costs a cache miss
+local function is_query(query)
+  return not query:find("%f[%w_]mutation%f[^%w_]")
+     and not query:find("%f[%w_]subscription%f[^%w_]")
+end
+
+-- Role and user the result is computed for, nil when it must not be cached
+local function get_identity()
+  if kong.request.get_header("X-Hasura-Admin-Secret") then
+    return nil
+  end
+
+  if not kong.request.get_header("Authorization") then
+    return "anonymous", ""
+  end
+
+  -- Set by the bundled jwt plugin once the token is verified; any other
+  -- token is left for Hasura to reject
+  local token = kong.ctx.shared.authenticated_jwt_token
+  if not token then
+    return nil
+  end
+
+  local jwt = tokens.parse(token)
+  local claims = jwt and jwt.claims or {}
+  local role = kong.request.get_header("X-Hasura-Role") or claims.role or "authenticated"
+  return role, claims.sub or ""
+end
+
+local function store(premature, conf, key, value, ttl)
+  if premature then
+    return
+  end
+
+  local red, conn_err = connection.connect(conf)
+  if not red then
+    kong.log.err("GraphQL Cache Connection Error: ", conn_err)
+    return
+  end
+
+  local ok, err = red:set(key, value, "EX", ttl)
+  if not ok then
+    kong.log.err("GraphQL Cache Redis SET failed: ", err)
+    return red:close()
+  end
+
+  connection.release(conf, red)
+end
+
+function GraphqlCacheHandler:access(conf)
+  if kong.request.get_method() ~= "POST" then
+    return
+  end
+
+  local raw = kong.request.get_raw_body()
+  local body = raw and cjson.decode(raw)
+  -- Batched requests go to Hasura untouched
+  if type(body) ~= "table" or body[1] then
+    return
+  end
+
+  local ttl
+  local rewrite = false
+  local query = body.query
+
+  local extensions = type(body.extensions) == "table" and body.extensions
+  local persisted = extensions and type(extensions.persistedQuery) == "table" and extensions.persistedQuery
+  if type(query) ~= "string" and persisted and type(persisted.sha256Hash) == "string" then
+    local entry = load_collections(conf)[persisted.sha256Hash:lower()]
+    if not entry then
+      return kong.response.exit(200, PERSISTED_QUERY_NOT_FOUND)
+    end
+
+    query = entry.query
+    body.query = query
+    body.extensions = nil
+    rewrite = true
+    if entry.cached then
+      ttl = conf.ttl
+    end
+  end
+
+  if type(query) ~= "string" then
+    return
+  end
+
+  local directive = directive_ttl(conf, query)
+  if directive then
+    ttl = directive
+    body.query = strip_directive(query)
+    rewrite = true
+  end
+
+  if rewrite then
+    kong.service.request.set_raw_body(cjson.encode(body))
+  end
+
+  if not ttl or not is_query(query) then
+    return
+  end
+
+  local role, sub = get_identity()
+  if not role then
+    return
+  end
+
+  local variables = body.variables ~= nil and cjson.encode(body.variables) or ""
+  local key = REDIS_PREFIX .. role .. ":" ..
+              ngx.md5(concat({ sub, body.query, variables, tostring(body.operationName or "") }, "\0"))
+
+  local red, conn_err = connection.connect(conf, "replica")
+  if not red then
+    kong.log.err("GraphQL Cache Connection Error: ", conn_err)
+  else
+    local value, err = red:get(key)
+    if err then
+      kong.log.err("GraphQL Cache Redis GET failed: ", err)
+      red:close()
+    else
+      connection.release(conf, red)
+      if type(value) == "string" then
+        return kong.response.exit(200, value, {
+          ["Content-Type"] = "application/json; charset=utf-8",
+          ["X-Cache-Status"] = "Hit",
+        })
+      end
+    end
+  end
+
+  -- The cached body is replayed as is, it must not come back compressed
+  kong.service.request.clear_header("Accept-Encoding")
+
+  local ctx = kong.ctx.plugin
+  ctx.key = key
+  ctx.ttl = ttl
+end
+
+function GraphqlCacheHandler:header_filter(conf)
+  local ctx = kong.ctx.plugin
+  if not ctx.key then
+    return
+  end
+
+  local length = tonumber(kong.response.get_header("Content-Length"))
+  if kong.response.get_status() ~= 200 or (length and length > conf.max_body_size) then
+    ctx.key = nil
+    return
+  end
+
+  ctx.chunks = {}
+  ctx.size = 0
+
+  kong.response.set_header("X-Cache-Status", "Miss")
+end
+
+function GraphqlCacheHandler:body_filter(conf)
+  local ctx = kong.ctx.plugin
+  if not ctx.key then
+    return
+  end
+
+  local chunk, eof = ngx.arg[1], ngx.arg[2]
+
+  ctx.size = ctx.size + #chunk
+  if ctx.size > conf.max_body_size then
+    ctx.key = nil
+    ctx.chunks = nil
+    return
+  end
+
+  ctx.chunks[#ctx.chunks + 1] = chunk
+
+  if eof then
+    local value = concat(ctx.chunks)
+    -- GraphQL reports failures with a 200, those results are not cached
+    local result = cjson.decode(value)
+    if type(result) == "table" and result.data and not result.errors then
+      ngx.timer.at(0, store, conf, ctx.key, value, ctx.ttl)
+    end
+  end
+end
+
+return GraphqlCacheHandler
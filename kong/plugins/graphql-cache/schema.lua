@@ -0,0 +1,32 @@
+local typedefs = require "kong.db.schema.typedefs"
+
+return {
+  name = "graphql-cache",
+  fields = {
+    { config = {
+        type = "record",
+        fields = {
+          -- Seconds a result is cached when @cached gives no ttl, and the upper bound
+          { ttl = { type = "integer", default = 60, gt = 0 } },
+          { max_ttl = { type = "integer", default = 300, gt = 0 } },
+          -- Larger results are never cached
+          { max_body_size = { type = "integer", default = 1048576, gt = 0 } },
+          -- Hasura query collections, persisted queries are looked up there by hash
+          { query_collections_path = { type = "string", default = "/kong/query_collections.yaml" } },
+          -- Persisted queries of these collections are cached without an @cached directive
+          { cached_collections = {
+              type = "array",
+              elements = { type = "string" },
+              default = { "cached-queries" },
+          } },
+          -- Same Redis as jwt-blacklist
+          { redis_host = typedefs.host({ default = "127.0.0.1" }) },
+          { redis_port = typedefs.port({ default = 6379 }) },
+          { redis_timeout = { type = "number", default = 1000 } },
+          { redis_pool_size = { type = "integer", default = 100, gt = 0 } },
+          { redis_backlog = { type = "integer", gt = 0 } },
+          { redis_keepalive_timeout = { type = "integer", default = 10000, gt = 0 } },
+        },
+    }, },
+  },
+}
@@ -0,0 +1,97 @@
+local bloom = require "kong.plugins.jwt-blacklist.bloom"
+local connection = require "kong.plugins.jwt-blacklist.connection"
+local revocation = require "kong.plugins.jwt-blacklist.revocation"
+
+-- Admin API endpoints of the jwt-blacklist plugin
+
+-- The Admin API has no plugin config at hand, look up the configured instance
+local function plugin_conf()
+  for plugin, err in kong.db.plugins:each() do
+    if err then
+      return nil, err
+    end
+    if plugin.name == "jwt-blacklist" and plugin.enabled then
+      return plugin.config
+    end
+  end
+  return nil, "jwt-blacklist plugin is not configured"
+end
+
+return {
+  ["/jwt-blacklist/bloom"] = {
+    -- Filter size, estimated false positive rate and rebuild time of this node
+    GET = function()
+      local conf, err = plugin_conf()
+      if not conf then
+        return kong.response.exit(404, { message = err })
+      end
+
+      local stats, stats_err = bloom.stats(conf)
+      if not stats then
+        return kong.response.exit(500, { message = stats_err })
+      end
+
+      return kong.response.exit(200, stats)
+    end,
+  },
+
+  ["/jwt-blacklist/revocations"] = {
+    -- Bulk revocation: { "tokens": [{ "signature", "exp" }], "users": ["<sub>"] }
+    POST = function(self)
+      local conf, err = plugin_conf()
+      if not conf then
+        return kong.response.exit(404, { message = err })
+      end
+
+      local tokens = self.params.tokens or {}
+      local users = self.params.users or {}
+      if type(tokens) ~= "table" or type(users) ~= "table" then
+        return kong.response.exit(400, { message = "tokens and users must be arrays" })
+      end
+
+      local red, conn_err = connection.connect(conf)
+      if not red then
+        return kong.response.exit(503, { message = conn_err })
+      end
+
+      local report, batch_err = revocation.revoke_batch(conf, red, tokens, users)
+      if batch_err then
+        red:close()
+        report.message = batch_err
+        return kong.response.exit(502, report)
+      end
+
+      connection.release(conf, red)
+      return kong.response.exit(report.failed > 0 and 207 or 201, report)
+    end,
+  },
+
+  ["/jwt-blacklist/users/:sub"] = {
+    -- Admin lockout: revoke every token issued to the user so far
+    POST = function(self)
+      if not revocation.valid_user_id(self.params.sub) then
+        return kong.response.exit(400, { message = "invalid user id" })
+      end
+
+      local conf, err = plugin_conf()
+      if not conf then
+        return kong.response.exit(404, { message = err })
+      end
+
+      local red, conn_err = connection.connect(conf)
+      if not red then
+        return kong.response.exit(503, { message = conn_err })
+      end
+
+      local watermark = ngx.time()
+      local ok, revoke_err = revocation.revoke_user(conf, red, self.params.sub, watermark)
+      connection.release(conf, red)
+
+      if not ok then
+        return kong.response.exit(500, { message = revoke_err })
+      end
+
+      return kong.response.exit(201, { sub = self.params.sub, revoked_before = watermark })
+    end,
+  },
+}
@@ -0,0 +1,396 @@
+local bit = require "bit"
+local ffi = require "ffi"
+local resty_lock = require "resty.lock"
+
+-- Node-wide Bloom filter of revoked token signatures.
+--
+-- The bit array lives in a lua_shared_dict as fixed size string chunks
+-- ("<gen>:<index>"), so every worker of the node reads the same filter
+-- without copying it whole. Reads are lock-free, writes take a resty.lock.
+-- A rebuild fills a fresh generation from Redis in worker memory, writes it
+-- out and then flips the "gen" pointer, which also drops signatures of tokens
+-- that expired since the last build.
+--
+-- Chunks are only created by a rebuild. A chunk that is missing was evicted
+-- from a full dict, and lookups falling in it answer "maybe".
+local _M = {}
+
+local band, bor, lshift = bit.band, bit.bor, bit.lshift
+local byte, char, sub = string.byte, string.char, string.sub
+local floor, ceil, log, exp = math.floor, math.ceil, math.log, math.exp
+
+-- A chunk value and its shm node fit a 512 byte slab slot
+local CHUNK_BYTES = 384
+local CHUNK_BITS = CHUNK_BYTES * 8
+
+local KEY_PREFIX = "blocklist:token:"
+local SCAN_COUNT = 1000
+-- Seconds a worker may hold the rebuild claim before another worker retries;
+-- the "building" mark expires with it, in case the worker died mid-build
+local REBUILD_CLAIM_TTL = 300
+
+-- Filter geometry for n expected items at false positive rate p
+local function geometry(capacity, fp_rate)
+  local bits = ceil(-capacity * log(fp_rate) / (log(2) ^ 2))
+  bits = ceil(bits / CHUNK_BITS) * CHUNK_BITS
+  local hashes = math.max(1, floor(bits / capacity * log(2) + 0.5))
+  return bits, hashes
+end
+
+-- Kirsch-Mitzenmacher double hashing over the first 8 bytes of an MD5
+local function hash_pair(signature)
+  local d = ngx.md5_bin(signature)
+  local b1, b2, b3, b4, b5, b6, b7, b8 = byte(d, 1, 8)
+  local h1 = b1 * 16777216 + b2 * 65536 + b3 * 256 + b4
+  local h2 = b5 * 16777216 + b6 * 65536 + b7 * 256 + b8
+  return h1, h2
+end
+
+local function get_shm(conf)
+  local shm = ngx.shared[conf.bloom_shm]
+  if not shm then
+    return nil, "lua_shared_dict '" .. conf.bloom_shm .. "' is not defined"
+  end
+  return shm
+end
+
+-- Evicted chunks answer "maybe"; the next claim rebuilds the filter
+local function degrade(shm, gen)
+  shm:set("degraded:" .. gen, true)
+  shm:delete("rebuilt_at")
+end
+
+-- Set the signature's bits in one generation, returns true if any bit was new
+local function set_bits(shm, gen, signature)
+  local bits = shm:get("bits:" .. gen)
+  local hashes = shm:get("hashes:" .. gen)
+  if not bits or not hashes then
+    return false
+  end
+
+  local h1, h2 = hash_pair(signature)
+  local changed = false
+
+  for i = 0, hashes - 1 do
+    local pos = (h1 + i * h2) % bits
+    local offset = pos % CHUNK_BITS
+    local key = gen .. ":" .. floor(pos / CHUNK_BITS)
+    local chunk = shm:get(key)
+    if not chunk then
+      -- Never recreate it: the bits it held are lost, "maybe" stays correct
+      degrade(shm, gen)
+    else
+      local index = floor(offset / 8) + 1
+      local value = byte(chunk, index)
+      local mask = lshift(1, offset % 8)
+      if band(value, mask) == 0 then
+        chunk = sub(chunk, 1, index - 1) .. char(bor(value, mask)) .. sub(chunk, index + 1)
+        local ok, err, forcible = shm:set(key, chunk)
+        if not ok then
+          return nil, "failed to store filter chunk: " .. err
+        end
+        if forcible then
+          degrade(shm, gen)
+        end
+        changed = true
+      end
+    end
+  end
+
+  if changed then
+    shm:incr("items:" .. gen, 1, 0)
+  end
+
+  return changed
+end
+
+local function clear(shm, gen, bits)
+  for i = 0, bits / CHUNK_BITS - 1 do
+    shm:delete(gen .. ":" .. i)
+  end
+  shm:delete("bits:" .. gen)
+  shm:delete("hashes:" .. gen)
+  shm:delete("items:" .. gen)
+  shm:delete("degraded:" .. gen)
+  shm:delete("pending:" .. gen)
+  shm:delete("pending_lost:" .. gen)
+end
+
+-- True once a generation has been built, before that every lookup goes to Redis
+function _M.ready(conf)
+  local shm = ngx.shared[conf.bloom_shm]
+  return shm ~= nil and (shm:get("gen") or 0) > 0
+end
+
+-- False means the signature was definitely never revoked
+function _M.contains(conf, signature)
+  local shm = ngx.shared[conf.bloom_shm]
+  local gen = shm:get("gen")
+  local bits = gen and shm:get("bits:" .. gen)
+  local hashes = gen and shm:get("hashes:" .. gen)
+  if not bits or not hashes then
+    return true
+  end
+
+  local h1, h2 = hash_pair(signature)
+  for i = 0, hashes - 1 do
+    local pos = (h1 + i * h2) % bits
+    local offset = pos % CHUNK_BITS
+    local chunk = shm:get(gen .. ":" .. floor(pos / CHUNK_BITS))
+    if not chunk then
+      -- A rebuild may have flipped and cleared our generation mid-lookup
+      if shm:get("gen") ~= gen then
+        return _M.contains(conf, signature)
+      end
+      -- Evicted
+      return true
+    end
+    if band(byte(chunk, floor(offset / 8) + 1), lshift(1, offset % 8)) == 0 then
+      return false
+    end
+  end
+
+  return true
+end
+
+-- Add a revoked signature to the live generation and to one being built
+function _M.add(conf, signature)
+  local shm, err = get_shm(conf)
+  if not shm then
+    return nil, err
+  end
+
+  local lock, lock_err = resty_lock:new(conf.bloom_shm)
+  if not lock then
+    return nil, "failed to create lock: " .. lock_err
+  end
+
+  local _, lerr = lock:lock("lock:write")
+  if lerr then
+    return nil, "failed to acquire lock: " .. lerr
+  end
+
+  local gen = shm:get("gen")
+  local building = shm:get("building")
+  local ok, set_err = true, nil
+  if gen then
+    ok, set_err = set_bits(shm, gen, signature)
+  end
+  if building then
+    -- The generation being built is in the rebuilding worker's memory, it
+    -- picks these up before writing it out
+    local len, push_err = shm:lpush("pending:" .. building, signature)
+    if not len then
+      shm:set("pending_lost:" .. building, true)
+      ok, set_err = nil, "failed to queue for the rebuild: " .. push_err
+    end
+  end
+
+  lock:unlock()
+
+  if ok == nil then
+    return nil, set_err
+  end
+  return true
+end
+
+-- Set a signature's bits in a generation held in worker memory
+local function set_buffer_bits(buf, bits, hashes, signature)
+  local h1, h2 = hash_pair(signature)
+  for i = 0, hashes - 1 do
+    local pos = (h1 + i * h2) % bits
+    local index = floor(pos / 8)
+    buf[index] = bor(buf[index], lshift(1, pos % 8))
+  end
+end
+
+-- Fill a new generation from the Redis blocklist and make it the live one
+function _M.rebuild(conf, red)
+  local shm, err = get_shm(conf)
+  if not shm then
+    return nil, err
+  end
+
+  ngx.update_time()
+  local started = ngx.now()
+
+  local gen = (shm:get("gen") or 0) + 1
+  local bits, hashes = geometry(conf.bloom_capacity, conf.bloom_fp_rate)
+
+  -- Leftovers of an aborted build would only add false positives, still drop them
+  local stale_bits = shm:get("bits:" .. gen)
+  if stale_bits then
+    clear(shm, gen, stale_bits)
+  end
+  shm:delete("pending:" .. gen)
+  shm:delete("pending_lost:" .. gen)
+  shm:set("building", gen, REBUILD_CLAIM_TTL)
+
+  local lock, lock_err = resty_lock:new(conf.bloom_shm)
+  if not lock then
+    shm:delete("building")
+    return nil, "failed to create lock: " .. lock_err
+  end
+
+  local buf = ffi.new("uint8_t[?]", bits / 8)
+  local items = 0
+
+  local cursor = "0"
+  repeat
+    local res, scan_err = red:scan(cursor, "MATCH", KEY_PREFIX .. "*", "COUNT", SCAN_COUNT)
+    if not res then
+      shm:delete("building")
+      return nil, "Redis SCAN failed: " .. (scan_err or "unknown")
+    end
+
+    cursor = res[1]
+    for _, key in ipairs(res[2]) do
+      set_buffer_bits(buf, bits, hashes, key:sub(#KEY_PREFIX + 1))
+      items = items + 1
+    end
+  until cursor == "0"
+
+  local _, lerr = lock:lock("lock:write")
+  if lerr then
+    shm:delete("building")
+    return nil, "failed to acquire lock: " .. lerr
+  end
+
+  local function abort(message)
+    shm:delete("building")
+    lock:unlock()
+    clear(shm, gen, bits)
+    return nil, message
+  end
+
+  if shm:get("pending_lost:" .. gen) then
+    return abort("revocations during the build were lost")
+  end
+
+  -- Revocations that arrived while Redis was scanned
+  while true do
+    local signature = shm:rpop("pending:" .. gen)
+    if not signature then
+      break
+    end
+    set_buffer_bits(buf, bits, hashes, signature)
+    items = items + 1
+  end
+
+  shm:set("bits:" .. gen, bits)
+  shm:set("hashes:" .. gen, hashes)
+  shm:set("items:" .. gen, items)
+
+  for i = 0, bits / CHUNK_BITS - 1 do
+    local ok, set_err, forcible = shm:set(gen .. ":" .. i, ffi.string(buf + i * CHUNK_BYTES, CHUNK_BYTES))
+    if not ok then
+      return abort("failed to store filter chunk: " .. set_err)
+    end
+    if forcible then
+      -- Whatever was evicted may belong to the live generation
+      local live = shm:get("gen")
+      if live then
+        shm:set("degraded:" .. live, true)
+      end
+      return abort("lua_shared_dict '" .. conf.bloom_shm .. "' is too small for two filter generations")
+    end
+  end
+
+  local old_gen = shm:get("gen")
+  shm:set("gen", gen)
+  shm:delete("building")
+
+  lock:unlock()
+
+  if old_gen then
+    clear(shm, old_gen, shm:get("bits:" .. old_gen) or 0)
+  end
+
+  ngx.update_time()
+  shm:set("rebuild_ms", floor((ngx.now() - started) * 1000))
+  shm:set("rebuilt_at", ngx.time())
+
+  return true
+end
+
+-- Claim the periodic rebuild for this node, returns true if the caller should run it
+function _M.claim_rebuild(conf)
+  local shm = ngx.shared[conf.bloom_shm]
+  if not shm then
+    return false
+  end
+
+  local rebuilt_at = shm:get("rebuilt_at")
+  if rebuilt_at and ngx.time() - rebuilt_at < conf.bloom_rebuild_interval then
+    return false
+  end
+
+  if shm:add("lock:rebuild", true, REBUILD_CLAIM_TTL) ~= true then
+    return false
+  end
+
+  -- Only the claim holder builds: a mark left now is from a dead worker
+  shm:delete("building")
+  return true
+end
+
+-- Release the claim, or keep it for retry_after seconds after a failed build
+function _M.release_rebuild(conf, retry_after)
+  local shm = ngx.shared[conf.bloom_shm]
+  if not shm then
+    return
+  end
+
+  if retry_after then
+    shm:set("lock:rebuild", true, retry_after)
+  else
+    shm:delete("lock:rebuild")
+  end
+end
+
+-- Force the next claim to rebuild, used when revocations may have been missed
+function _M.request_rebuild(conf)
+  local shm = ngx.shared[conf.bloom_shm]
+  if shm then
+    shm:delete("rebuilt_at")
+  end
+end
+
+function _M.stats(conf)
+  local shm, err = get_shm(conf)
+  if not shm then
+    return nil, err
+  end
+
+  local gen = shm:get("gen")
+  local bits = gen and shm:get("bits:" .. gen)
+  local hashes = gen and shm:get("hashes:" .. gen)
+  local items = gen and shm:get("items:" .. gen) or 0
+
+  local fill, fp_rate
+  if bits then
+    -- Expected share of set bits
+    fill = 1 - exp(-hashes * items / bits)
+    fp_rate = fill ^ hashes
+  end
+
+  return {
+    ready = gen ~= nil,
+    generation = gen,
+    capacity = conf.bloom_capacity,
+    target_fp_rate = conf.bloom_fp_rate,
+    size_bits = bits,
+    hashes = hashes,
+    items = items,
+    estimated_fill_ratio = fill,
+    estimated_fp_rate = fp_rate,
+    -- Chunks were evicted, lookups in them go to Redis until the next rebuild
+    degraded = gen ~= nil and shm:get("degraded:" .. gen) == true,
+    building = shm:get("building") ~= nil,
+    rebuild_ms = shm:get("rebuild_ms"),
+    rebuilt_at = shm:get("rebuilt_at"),
+    shm_free_bytes = shm:free_space(),
+  }
+end
+
+return _M
@@ -0,0 +1,121 @@
+local lrucache = require "resty.lrucache"
+
+-- Two-level verdict cache for the jwt-blacklist plugin.
+--
+-- Level 1 is a per-worker LRU, level 2 is a lua_shared_dict shared by every
+-- worker of the node. Both hold "revoked" and "ok" verdicts keyed by the
+-- token signature, so a hit never leaves the nginx process.
+local _M = {
+  REVOKED = "revoked",
+  OK = "ok",
+}
+
+local REVOKED = _M.REVOKED
+local OK = _M.OK
+
+local lru
+local shm
+
+-- Lazily create the caches, the first request brings the plugin config along
+function _M.init(conf)
+  if lru then
+    return true
+  end
+
+  local err
+  lru, err = lrucache.new(conf.cache_size)
+  if not lru then
+    return nil, "Failed to create LRU cache: " .. (err or "unknown")
+  end
+
+  shm = ngx.shared[conf.cache_shm]
+  if not shm then
+    kong.log.warn("lua_shared_dict '", conf.cache_shm, "' is not defined, using the worker cache only")
+  end
+
+  return true
+end
+
+function _M.get(key)
+  local verdict = lru:get(key)
+  if verdict then
+    return verdict
+  end
+
+  if not shm then
+    return nil
+  end
+
+  verdict = shm:get(key)
+  if verdict then
+    -- Promote into the worker cache for the time the node entry has left
+    local ttl = shm:ttl(key)
+    lru:set(key, verdict, ttl and ttl > 0 and ttl or nil)
+  end
+
+  return verdict
+end
+
+function _M.set_revoked(key, ttl)
+  if not lru then
+    return
+  end
+
+  lru:set(key, REVOKED, ttl)
+  if shm then
+    shm:set(key, REVOKED, ttl)
+  end
+end
+
+-- Never let a late "ok" (read from Redis before a revocation arrived)
+-- overwrite a "revoked" verdict that landed in the meantime.
+function _M.set_ok(key, ttl)
+  if lru:get(key) == REVOKED then
+    return
+  end
+
+  if shm then
+    local ok = shm:add(key, OK, ttl)
+    if not ok and shm:get(key) == REVOKED then
+      local revoked_ttl = shm:ttl(key)
+      lru:set(key, REVOKED, revoked_ttl and revoked_ttl > 0 and revoked_ttl or nil)
+      return
+    end
+  end
+
+  lru:set(key, OK, ttl)
+end
+
+-- "Revoked before" watermark of a user, 0 when the user has none
+function _M.get_watermark(key)
+  return _M.get(key)
+end
+
+-- Watermarks only move forward, a stale read must not lower a newer one
+function _M.raise_watermark(key, watermark, ttl)
+  if not lru then
+    return
+  end
+
+  local current = _M.get(key)
+  if current and current >= watermark then
+    return
+  end
+
+  lru:set(key, watermark, ttl)
+  if shm then
+    shm:set(key, watermark, ttl)
+  end
+end
+
+-- Drop every verdict, used when the invalidation stream may have gaps
+function _M.flush()
+  if lru then
+    lru:flush_all()
+  end
+  if shm then
+    shm:flush_all()
+  end
+end
+
+return _M
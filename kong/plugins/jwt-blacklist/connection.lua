@@ -0,0 +1,247 @@
+local redis = require "resty.redis"
+
+-- Pooled Redis connections for the jwt-blacklist plugin.
+--
+-- Connections are authenticated once, when they are first opened; a cosocket
+-- coming back from the keepalive pool is used as is. With Sentinel configured
+-- the primary (and optionally the replicas) are resolved and cached per worker.
+local _M = {}
+
+local SECRET_PATH = "/run/secrets/redis_password"
+
+-- Seconds to wait before re-subscribing after a channel dropped
+local SUBSCRIBE_RETRY_DELAY = 2
+
+-- Redis password, read once per worker
+local password
+
+-- Sentinel resolution cached per worker
+local topology = {
+  primary = nil,
+  replicas = nil,
+  expires_at = 0,
+}
+
+local function get_password(conf)
+  if password then
+    return password
+  end
+
+  if conf.redis_password and conf.redis_password ~= "" then
+    password = conf.redis_password
+    return password
+  end
+
+  -- Read the secret file mounted via Docker Secrets
+  local f = io.open(SECRET_PATH, "r")
+  if not f then
+    return nil, "Secret file not found at " .. SECRET_PATH
+  end
+
+  local pass = f:read("*all")
+  f:close()
+
+  if not pass or pass == "" then
+    return nil, "Secret file is empty"
+  end
+
+  -- Strip whitespace/newlines from the password string
+  password = pass:gsub("%s+", "")
+  return password
+end
+
+-- "host:port" to host, port
+local function split_address(address)
+  local host, port = address:match("^(.+):(%d+)$")
+  if not host then
+    return address, 26379
+  end
+  return host, tonumber(port)
+end
+
+-- Ask the sentinels for the current primary and healthy replicas
+local function resolve(conf)
+  if topology.primary and ngx.now() < topology.expires_at then
+    return topology
+  end
+
+  local last_err = "no sentinel configured"
+  for _, address in ipairs(conf.redis_sentinel_addresses or {}) do
+    local host, port = split_address(address)
+    local red = redis:new()
+    red:set_timeout(conf.redis_timeout)
+
+    local ok, err = red:connect(host, port)
+    if ok then
+      local primary, perr = red:sentinel("get-master-addr-by-name", conf.redis_sentinel_master)
+      if type(primary) == "table" and primary[1] then
+        local replicas = {}
+
+        if conf.redis_read_from_replicas then
+          local list = red:sentinel("replicas", conf.redis_sentinel_master)
+          for _, flat in ipairs(type(list) == "table" and list or {}) do
+            local info = {}
+            for i = 1, #flat, 2 do
+              info[flat[i]] = flat[i + 1]
+            end
+            local flags = info.flags or ""
+            if not flags:find("down", 1, true) and not flags:find("disconnected", 1, true) then
+              replicas[#replicas + 1] = { host = info.ip, port = tonumber(info.port) }
+            end
+          end
+        end
+
+        red:set_keepalive(conf.redis_keepalive_timeout, conf.redis_pool_size)
+
+        topology.primary = { host = primary[1], port = tonumber(primary[2]) }
+        topology.replicas = replicas
+        topology.expires_at = ngx.now() + conf.redis_sentinel_refresh_interval
+        return topology
+      end
+
+      last_err = "sentinel " .. address .. " does not know master '" ..
+                 conf.redis_sentinel_master .. "': " .. (perr or "null reply")
+      red:close()
+    else
+      last_err = "sentinel " .. address .. " connection failed: " .. (err or "unknown")
+    end
+  end
+
+  return nil, last_err
+end
+
+local function open(conf, host, port)
+  local red = redis:new()
+  red:set_timeout(conf.redis_timeout)
+
+  local ok, err = red:connect(host, port, {
+    pool_size = conf.redis_pool_size,
+    backlog = conf.redis_backlog,
+  })
+  if not ok then
+    return nil, "Connection failed: " .. (err or "unknown")
+  end
+
+  -- Pooled connections were authenticated when they were first opened
+  local reused = red:get_reused_times()
+  if reused == 0 then
+    local pass, pass_err = get_password(conf)
+    if not pass then
+      red:close()
+      return nil, pass_err
+    end
+
+    local res, auth_err = red:auth(pass)
+    if not res then
+      -- The secret may have been rotated, read it again next time
+      password = nil
+      red:close()
+      return nil, "Auth command failed: " .. (auth_err or "wrong password")
+    end
+  end
+
+  return red, nil
+end
+
+-- Connect to Redis, role "replica" routes reads to a replica when there is one
+function _M.connect(conf, role)
+  if not conf.redis_sentinel_master then
+    return open(conf, conf.redis_host, conf.redis_port)
+  end
+
+  local topo, err = resolve(conf)
+  if not topo then
+    return nil, err
+  end
+
+  local primary, replicas = topo.primary, topo.replicas
+
+  if role == "replica" and #replicas > 0 then
+    local replica = replicas[math.random(#replicas)]
+    local red = open(conf, replica.host, replica.port)
+    if red then
+      return red, nil
+    end
+    -- Fall back to the primary, the replica list is refreshed on the next resolve
+    _M.invalidate()
+  end
+
+  local red, conn_err = open(conf, primary.host, primary.port)
+  if not red then
+    _M.invalidate()
+  end
+  return red, conn_err
+end
+
+-- Return a connection to the keepalive pool
+function _M.release(conf, red)
+  local ok, err = red:set_keepalive(conf.redis_keepalive_timeout, conf.redis_pool_size)
+  if not ok then
+    kong.log.warn("Redis set_keepalive failed: ", err)
+  end
+end
+
+-- Forget the resolved topology, e.g. after a failover turned the primary into a replica
+function _M.invalidate()
+  topology.primary = nil
+  topology.replicas = nil
+  topology.expires_at = 0
+end
+
+-- Re-resolve on errors that mean we talked to the wrong node
+function _M.check_error(err)
+  if err and (err:find("READONLY", 1, true) or err:find("MASTERDOWN", 1, true)) then
+    _M.invalidate()
+  end
+end
+
+-- Background loop delivering the messages of a pub/sub channel
+local function subscribe_loop(premature, conf, channel, handlers, resubscribe)
+  if premature then
+    return
+  end
+
+  local red, conn_err = _M.connect(conf)
+  if not red then
+    kong.log.err("Subscriber Connection Error on ", channel, ": ", conn_err)
+    return ngx.timer.at(SUBSCRIBE_RETRY_DELAY, subscribe_loop, conf, channel, handlers, true)
+  end
+
+  local ok, sub_err = red:subscribe(channel)
+  if not ok then
+    kong.log.err("Redis SUBSCRIBE failed on ", channel, ": ", sub_err)
+    red:close()
+    return ngx.timer.at(SUBSCRIBE_RETRY_DELAY, subscribe_loop, conf, channel, handlers, true)
+  end
+
+  if handlers.on_subscribed then
+    handlers.on_subscribed(resubscribe)
+  end
+
+  while not ngx.worker.exiting() do
+    local res, read_err = red:read_reply()
+    if res then
+      if res[1] == "message" then
+        handlers.on_message(res[3])
+      end
+    elseif read_err ~= "timeout" then
+      kong.log.err("Subscriber Read Error on ", channel, ": ", read_err)
+      break
+    end
+  end
+
+  red:close()
+
+  if not ngx.worker.exiting() then
+    return ngx.timer.at(SUBSCRIBE_RETRY_DELAY, subscribe_loop, conf, channel, handlers, true)
+  end
+end
+
+-- Follow a channel from a background timer, reconnecting when it drops.
+-- handlers.on_message(message) gets every message; handlers.on_subscribed(resubscribe)
+-- runs once subscribed, resubscribe being true after a connection loss.
+function _M.subscribe(conf, channel, handlers)
+  return ngx.timer.at(0, subscribe_loop, conf, channel, handlers, false)
+end
+
+return _M
@@ -1,48 +1,151 @@
-local redis = require "resty.redis"
-local jwt_parser = require "kong.plugins.jwt.jwt_parser"
+local cache = require "kong.plugins.jwt-blacklist.cache"
+local bloom = require "kong.plugins.jwt-blacklist.bloom"
+local connection = require "kong.plugins.jwt-blacklist.connection"
+local revocation = require "kong.plugins.jwt-blacklist.revocation"
+local metrics = require "kong.plugins.jwt-blacklist.metrics"
+local tokens = require "kong.plugins.jwt-blacklist.tokens"
 
 local JwtBlacklistHandler = {
   VERSION = "1.2.3",
   PRIORITY = 900,
 }
 
--- Private helper to connect and authenticate to Redis
-local function get_redis_conn(conf)
-    local red = redis:new()
-    red:set_timeout(conf.redis_timeout or 1000)
+-- Seconds to wait before retrying a failed Bloom filter rebuild
+local REBUILD_RETRY_DELAY = 2
 
-    local ok, err = red:connect(conf.redis_host, conf.redis_port)
-    if not ok then
-        return nil, "Connection failed: " .. (err or "unknown")
-    end
+-- Seconds between two refreshes of the Bloom filter gauges
+local BLOOM_METRICS_INTERVAL = 10
 
-    -- Read the secret file mounted via Docker Secrets
-    local path = "/run/secrets/redis_password"
-    local f = io.open(path, "r")
-    if not f then
-        return nil, "Secret file not found at " .. path
-    end
+-- Whether this worker already follows the invalidation channel
+local subscriber_started = false
 
-    local pass = f:read("*all")
-    f:close()
+-- Whether the Bloom filter gauges are refreshed, by the first worker only
+local bloom_metrics_started = false
 
-    if not pass or pass == "" then
-        return nil, "Secret file is empty"
-    end
+-- Client spans around the Redis round trips, only recorded in sampled traces
+local REDIS_SPAN_OPTIONS = { span_kind = 3 }
 
-    -- Strip whitespace/newlines from the password string
-    pass = pass:gsub("%s+", "")
+local function start_redis_span(name, command)
+  local span = kong.tracing.start_span(name, REDIS_SPAN_OPTIONS)
+  span:set_attribute("db.system", "redis")
+  span:set_attribute("db.operation", command)
+  return span
+end
 
-    -- Authenticate with Redis
-    local res, auth_err = red:auth(pass)
-    if not res then
-        return nil, "Auth command failed: " .. (auth_err or "wrong password")
+local function fail_span(span, err)
+  span:record_error(err)
+  span:set_status(2)
+  span:finish()
+end
+
+local function load_secret(key)
+  local secret, err = kong.db.jwt_secrets:select_by_key(key)
+  if err then
+    return nil, err
+  end
+  return secret
+end
+
+-- The logout route runs without the jwt plugin, so before a token may log its
+-- user out everywhere its signature is checked the way that plugin does it
+local function is_verified(conf, jwt, token)
+  if kong.ctx.shared.authenticated_jwt_token == token then
+    return true
+  end
+
+  local key = jwt.claims[conf.key_claim_name] or jwt.header[conf.key_claim_name]
+  if type(key) ~= "string" then
+    return false
+  end
+
+  local secret, err = kong.cache:get(kong.db.jwt_secrets:cache_key(key), nil, load_secret, key)
+  if not secret then
+    if err then
+      kong.log.err("Blacklist JWT Secret Error: ", err)
     end
+    return false
+  end
+
+  local algorithm = secret.algorithm or "HS256"
+  if jwt.header.alg ~= algorithm then
+    return false
+  end
+
+  local value = algorithm:sub(1, 2) == "HS" and secret.secret or secret.rsa_public_key
+  if not value or not jwt:verify_signature(value) then
+    return false
+  end
+
+  return (jwt:verify_registered_claims({ "exp" }))
+end
 
-    return red, nil
+-- Keep this worker's caches in sync with revocations published by any
+-- worker of any node
+local function subscribe(conf)
+  return connection.subscribe(conf, conf.invalidation_channel, {
+    on_message = function(message)
+      revocation.apply(conf, message)
+    end,
+
+    -- Revocations published while we were not listening are lost, so nothing
+    -- cached before this point can be trusted
+    on_subscribed = function(resubscribe)
+      cache.flush()
+      if resubscribe and conf.bloom_enabled then
+        bloom.request_rebuild(conf)
+      end
+    end,
+  })
+end
+
+local function update_bloom_metrics(premature, conf)
+  if premature then
+    return
+  end
+
+  local stats = bloom.stats(conf)
+  if stats then
+    metrics.bloom(stats)
+  end
+end
+
+-- Background rebuild of the node's Bloom filter from the Redis blocklist
+local function rebuild_bloom(premature, conf)
+  if premature then
+    return
+  end
+
+  local red, conn_err = connection.connect(conf, "replica")
+  if not red then
+    kong.log.err("Blacklist Bloom Rebuild Connection Error: ", conn_err)
+    return bloom.release_rebuild(conf, REBUILD_RETRY_DELAY)
+  end
+
+  local ok, err = bloom.rebuild(conf, red)
+  if not ok then
+    red:close()
+    kong.log.err("Blacklist Bloom Rebuild Error: ", err)
+    return bloom.release_rebuild(conf, REBUILD_RETRY_DELAY)
+  end
+
+  connection.release(conf, red)
+  bloom.release_rebuild(conf)
+  update_bloom_metrics(false, conf)
+end
+
+function JwtBlacklistHandler:init_worker()
+  local ok, err = metrics.init()
+  if not ok then
+    kong.log.info("Blacklist metrics disabled: ", err)
+  end
 end
 
 function JwtBlacklistHandler:access(conf)
+  -- Only ever set from a verified token, never taken from the client
+  if conf.user_header then
+    kong.service.request.clear_header(conf.user_header)
+  end
+
   local path = kong.request.get_path()
 
   -- EXEMPTION: Never block the login or signup paths
@@ -50,42 +153,86 @@ function JwtBlacklistHandler:access(conf)
     return
   end
 
-  -- Extract Authorization Header
-  local auth_header = kong.request.get_header("Authorization")
-  if not auth_header then return end
+  -- Set by the bundled jwt plugin once the token is verified, wherever it
+  -- found it: the Authorization header, a cookie or the ?jwt= query argument.
+  -- It rejects requests carrying more than one token.
+  local verified = kong.ctx.shared.authenticated_jwt_token
+  local token = verified
 
-  local _, _, token = string.find(auth_header, "Bearer%s+(.+)")
-  if not token then return end
+  -- Routes without the jwt plugin (logout) only send the header
+  if not token then
+    local auth_header = kong.request.get_header("Authorization")
+    if not auth_header then return end
+    token = auth_header:match("Bearer%s+(.+)")
+    if not token then return end
+  end
 
-  -- Parse JWT and extract Signature (as the unique fingerprint)
-  local jwt, err = jwt_parser:new(token)
+  -- Parse JWT and extract Signature (as the unique fingerprint); verified
+  -- tokens come parsed from the per-worker cache
+  local jwt, err = tokens.parse(token)
   if err or not jwt.signature then
     kong.log.err("Failed to parse JWT signature")
     return
   end
 
   local fingerprint = jwt.signature
-  local redis_key = "blocklist:token:" .. fingerprint
+  local claims = jwt.claims or {}
+  local exp = claims.exp or 0
+  local sub = conf.revoke_by_user and type(claims.sub) == "string" and claims.sub
+
+  local cached = false
+  if conf.cache_enabled then
+    local cache_err
+    cached, cache_err = cache.init(conf)
+    if not cached then
+      kong.log.err("Blacklist Cache Error: ", cache_err)
+    end
+  end
+
+  -- Both the verdict cache and the Bloom filter follow the invalidation channel
+  if (cached or conf.bloom_enabled) and not subscriber_started then
+    subscriber_started = true
+    subscribe(conf)
+  end
 
   -- LOGIC A: Handle Logout (The "Writer")
   if path == "/auth/logout" then
-    local red, conn_err = get_redis_conn(conf)
+    local span = start_redis_span("jwt-blacklist: redis SETEX", "SETEX")
+    local started = metrics.start()
+    local red, conn_err = connection.connect(conf)
+    metrics.observe_redis("connect", started)
     if red then
-      local exp = (jwt.claims and jwt.claims.exp) or 0
-      local ttl = exp - os.time()
-
-      if ttl > 0 then
-        -- Set the key in Redis with a TTL matching the token's remaining life
-        local ok, set_err = red:setex(redis_key, ttl, "revoked")
-        if ok then
-            kong.log.notice("Token blacklisted successfully: ", fingerprint:sub(1,8))
+      metrics.connection(red:get_reused_times() > 0)
+
+      started = metrics.start()
+      local ok, revoke_err = revocation.revoke_token(conf, red, fingerprint, exp)
+      metrics.observe_redis("setex", started)
+      if ok then
+        kong.log.notice("Token blacklisted successfully: ", fingerprint:sub(1,8))
+        span:finish()
+      else
+        kong.log.err("Blacklist Logout Error: ", revoke_err)
+        fail_span(span, revoke_err)
+      end
+
+      -- "Log out everywhere" revokes every token the user holds with one write
+      if sub and kong.request.get_query_arg("scope") == "global" then
+        if is_verified(conf, jwt, token) then
+          ok, revoke_err = revocation.revoke_user(conf, red, sub)
+          if ok then
+            kong.log.notice("User tokens blacklisted successfully: ", sub)
+          else
+            kong.log.err("Blacklist Logout Error: ", revoke_err)
+          end
         else
-            kong.log.err("Redis SETEX failed: ", set_err)
+          kong.log.warn("Blacklist Logout: global logout with an unverified token ignored")
         end
       end
-      red:set_keepalive(10000, 100)
+
+      connection.release(conf, red)
     else
       kong.log.err("Blacklist Logout Error: ", conn_err)
+      fail_span(span, conn_err)
     end
     -- Continue to GoTrue so it can handle its internal session cleanup
     return
@@ -93,24 +240,112 @@ function JwtBlacklistHandler:access(conf)
 
   -- LOGIC B: Guard Check (The "Reader")
   -- This protects all backend upstreams (FastAPI, Go, Rust, etc.)
-  local red, conn_err = get_redis_conn(conf)
-  if not red then
-    kong.log.err("Blacklist Guard Connection Error: ", conn_err)
-    return -- Fail Open: Allow traffic if Redis is down
+  local cache_key = "token:" .. fingerprint
+  local verdict = cached and cache.get(cache_key)
+  if verdict then
+    metrics.lookup("cache", verdict == cache.REVOKED)
   end
+  local watermark = sub and cached and cache.get_watermark("user:" .. sub)
 
-  local res, get_err = red:get(redis_key)
-  red:set_keepalive(10000, 100)
+  -- A negative Bloom answer is definitive, only possible matches reach Redis
+  if not verdict and conf.bloom_enabled then
+    if bloom.claim_rebuild(conf) then
+      ngx.timer.at(0, rebuild_bloom, conf)
+    end
 
-  if get_err then
-    kong.log.err("Redis GET error: ", get_err)
-    return
+    if not bloom_metrics_started and metrics.enabled() and ngx.worker.id() == 0 then
+      bloom_metrics_started = true
+      ngx.timer.every(BLOOM_METRICS_INTERVAL, update_bloom_metrics, conf)
+    end
+
+    if bloom.ready(conf) and not bloom.contains(conf, fingerprint) then
+      verdict = cache.OK
+      metrics.lookup("bloom", false)
+    end
   end
 
-  if type(res) == "string" then
+  -- Fetch whatever is still unknown in a single round trip
+  local need_user = sub and not watermark
+  if not verdict or need_user then
+    local keys = {}
+    if not verdict then
+      keys[#keys + 1] = revocation.TOKEN_PREFIX .. fingerprint
+    end
+    if need_user then
+      keys[#keys + 1] = revocation.USER_PREFIX .. sub
+    end
+
+    local span = start_redis_span("jwt-blacklist: redis MGET", "MGET")
+    local started = metrics.start()
+    local red, conn_err = connection.connect(conf, "replica")
+    metrics.observe_redis("connect", started)
+    if not red then
+      kong.log.err("Blacklist Guard Connection Error: ", conn_err)
+      metrics.fail_open("connect")
+      fail_span(span, conn_err)
+      return -- Fail Open: Allow traffic if Redis is down
+    end
+    metrics.connection(red:get_reused_times() > 0)
+
+    started = metrics.start()
+    local res, get_err = red:mget(unpack(keys))
+    metrics.observe_redis("mget", started)
+    connection.release(conf, red)
+
+    if not res then
+      kong.log.err("Redis MGET error: ", get_err)
+      metrics.fail_open("command")
+      fail_span(span, get_err)
+      return
+    end
+    span:finish()
+
+    if not verdict then
+      local revoked = type(res[1]) == "string"
+      metrics.lookup("redis", revoked)
+      if revoked then
+        verdict = cache.REVOKED
+        if cached then
+          local ttl = exp - ngx.time()
+          cache.set_revoked(cache_key, ttl > 0 and ttl or conf.negative_ttl)
+        end
+      else
+        verdict = cache.OK
+        if cached then
+          cache.set_ok(cache_key, conf.negative_ttl)
+        end
+      end
+    end
+
+    if need_user then
+      watermark = tonumber(res[#keys]) or 0
+      if cached then
+        local ttl = watermark > 0 and watermark + conf.max_token_lifetime - ngx.time() or 0
+        if ttl <= 0 then
+          -- Bloom mode trusts the invalidation channel like the filter does:
+          -- "no watermark" holds until a user revocation arrives on it
+          ttl = conf.bloom_enabled and conf.max_token_lifetime or conf.negative_ttl
+        end
+        cache.raise_watermark("user:" .. sub, watermark, ttl)
+      end
+    end
+  end
+
+  if verdict == cache.REVOKED then
     kong.log.notice("REJECTED: Blacklisted token signature detected")
     return kong.response.exit(401, { message = "Token has been revoked (logged out)" })
   end
+
+  -- Both have one second resolution, a token issued in the second of the
+  -- revocation may predate it and is rejected as well
+  if watermark and watermark > 0 and (tonumber(claims.iat) or 0) <= watermark then
+    kong.log.notice("REJECTED: Token issued before the user's revocation watermark")
+    return kong.response.exit(401, { message = "Token has been revoked (logged out everywhere)" })
+  end
+
+  if conf.user_header and claims.sub and verified then
+    kong.service.request.set_header(conf.user_header, claims.sub)
+  end
 end
 
 return JwtBlacklistHandler
@@ -0,0 +1,147 @@
+-- Prometheus metrics of the jwt-blacklist plugin.
+--
+-- Registered with the bundled prometheus plugin's registry, so they come out
+-- of the same /metrics endpoint on the Status API. Counters and histograms
+-- are per-worker and synced to the shared dict from a timer; label values
+-- are the constant tables below, so recording allocates nothing. Without the
+-- prometheus plugin every function is a no-op.
+local _M = {}
+
+-- Milliseconds, nginx time has no finer resolution
+local LATENCY_BUCKETS = { 1, 2, 5, 10, 25, 50, 100, 250, 500, 1000 }
+
+local LABELS = {
+  connect = { "connect" },
+  mget = { "mget" },
+  setex = { "setex" },
+  reused = { "reused" },
+  new = { "new" },
+  connect_error = { "connect" },
+  command_error = { "command" },
+}
+
+-- Lookup results per source: { source, result }
+local LOOKUPS = {}
+for _, source in ipairs({ "cache", "bloom", "redis" }) do
+  LOOKUPS[source] = {
+    hit = { source, "hit" },
+    miss = { source, "miss" },
+  }
+end
+
+local metrics
+
+-- Called from init_worker, after the prometheus plugin created its registry
+function _M.init()
+  if metrics then
+    return true
+  end
+
+  local ok, exporter = pcall(require, "kong.plugins.prometheus.exporter")
+  if not ok then
+    return nil, "prometheus plugin is not installed"
+  end
+
+  local prometheus = exporter.get_prometheus()
+  if not prometheus then
+    return nil, "prometheus plugin is not initialized"
+  end
+
+  metrics = {
+    redis_latency = prometheus:histogram("jwt_blacklist_redis_latency_ms",
+      "Latency of the Redis commands of jwt-blacklist in ms",
+      { "command" }, LATENCY_BUCKETS),
+    connections = prometheus:counter("jwt_blacklist_redis_connections_total",
+      "Redis connections handed out to jwt-blacklist, from the keepalive pool or new",
+      { "pool" }),
+    lookups = prometheus:counter("jwt_blacklist_lookups_total",
+      "Blocklist lookups per source, hit meaning the token is revoked",
+      { "source", "result" }),
+    fail_open = prometheus:counter("jwt_blacklist_fail_open_total",
+      "Requests let through because Redis could not be asked",
+      { "reason" }),
+    bloom_items = prometheus:gauge("jwt_blacklist_bloom_items",
+      "Signatures in the node's live Bloom filter"),
+    bloom_size_bits = prometheus:gauge("jwt_blacklist_bloom_size_bits",
+      "Size of the node's live Bloom filter in bits"),
+    bloom_fill_ratio = prometheus:gauge("jwt_blacklist_bloom_fill_ratio",
+      "Estimated share of set bits in the node's Bloom filter"),
+    bloom_fp_rate = prometheus:gauge("jwt_blacklist_bloom_estimated_fp_rate",
+      "Estimated false positive rate of the node's Bloom filter"),
+    bloom_degraded = prometheus:gauge("jwt_blacklist_bloom_degraded",
+      "1 while evicted filter chunks send their lookups to Redis"),
+    bloom_building = prometheus:gauge("jwt_blacklist_bloom_building",
+      "1 while a Bloom filter rebuild is running on the node"),
+    bloom_rebuild_ms = prometheus:gauge("jwt_blacklist_bloom_rebuild_duration_ms",
+      "Duration of the last Bloom filter rebuild in ms"),
+    bloom_rebuilt_at = prometheus:gauge("jwt_blacklist_bloom_last_rebuild_seconds",
+      "Unix time of the last Bloom filter rebuild"),
+  }
+
+  return true
+end
+
+function _M.enabled()
+  return metrics ~= nil
+end
+
+-- Start of a timed section, nil when metrics are off
+function _M.start()
+  if not metrics then
+    return nil
+  end
+  ngx.update_time()
+  return ngx.now()
+end
+
+-- command is one of "connect", "mget", "setex"
+function _M.observe_redis(command, started)
+  if not started then
+    return
+  end
+  ngx.update_time()
+  metrics.redis_latency:observe((ngx.now() - started) * 1000, LABELS[command])
+end
+
+function _M.connection(reused)
+  if metrics then
+    metrics.connections:inc(1, reused and LABELS.reused or LABELS.new)
+  end
+end
+
+-- source is one of "cache", "bloom", "redis"
+function _M.lookup(source, hit)
+  if metrics then
+    local labels = LOOKUPS[source]
+    metrics.lookups:inc(1, hit and labels.hit or labels.miss)
+  end
+end
+
+-- Bloom filter state as returned by bloom.stats(); gauges are node-wide
+function _M.bloom(stats)
+  if not metrics then
+    return
+  end
+
+  metrics.bloom_items:set(stats.items)
+  metrics.bloom_size_bits:set(stats.size_bits or 0)
+  metrics.bloom_fill_ratio:set(stats.estimated_fill_ratio or 0)
+  metrics.bloom_fp_rate:set(stats.estimated_fp_rate or 0)
+  metrics.bloom_degraded:set(stats.degraded and 1 or 0)
+  metrics.bloom_building:set(stats.building and 1 or 0)
+  if stats.rebuild_ms then
+    metrics.bloom_rebuild_ms:set(stats.rebuild_ms)
+  end
+  if stats.rebuilt_at then
+    metrics.bloom_rebuilt_at:set(stats.rebuilt_at)
+  end
+end
+
+-- reason is "connect" or "command"
+function _M.fail_open(reason)
+  if metrics then
+    metrics.fail_open:inc(1, reason == "connect" and LABELS.connect_error or LABELS.command_error)
+  end
+end
+
+return _M
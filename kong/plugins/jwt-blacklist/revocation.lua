@@ -0,0 +1,234 @@
+local cache = require "kong.plugins.jwt-blacklist.cache"
+local bloom = require "kong.plugins.jwt-blacklist.bloom"
+local connection = require "kong.plugins.jwt-blacklist.connection"
+
+-- Writing revocations to Redis and applying them to the local caches.
+--
+-- Two kinds of revocation exist side by side:
+--   token  blocklist:token:<signature>, one key per token until it expires
+--   user   blocklist:user:<sub>, a "tokens issued before <ts> are invalid"
+--          watermark kept for max_token_lifetime seconds
+-- Every write is published on the invalidation channel as one
+-- "<kind> <id> <number>" line, number being the token exp or the watermark.
+local concat = table.concat
+
+-- Errors listed in a batch report, the counters stay exact
+local MAX_REPORTED_ERRORS = 100
+
+local _M = {
+  TOKEN_PREFIX = "blocklist:token:",
+  USER_PREFIX = "blocklist:user:",
+}
+
+local TOKEN_PREFIX = _M.TOKEN_PREFIX
+local USER_PREFIX = _M.USER_PREFIX
+
+-- Record a revoked token in this node's verdict cache and Bloom filter
+function _M.apply_token(conf, signature, exp)
+  local ttl = exp - ngx.time()
+  if ttl <= 0 then
+    return
+  end
+
+  cache.set_revoked("token:" .. signature, ttl)
+
+  if conf.bloom_enabled then
+    local ok, err = bloom.add(conf, signature)
+    if not ok then
+      kong.log.err("Blacklist Bloom Filter Error: ", err)
+    end
+  end
+end
+
+-- Record a user watermark in this node's cache
+function _M.apply_user(conf, sub, watermark)
+  local ttl = watermark + conf.max_token_lifetime - ngx.time()
+  if ttl > 0 then
+    cache.raise_watermark("user:" .. sub, watermark, ttl)
+  end
+end
+
+-- Apply an invalidation message received on the channel
+function _M.apply(conf, message)
+  for kind, id, number in message:gmatch("(%S+) (%S+) (%d+)") do
+    if kind == "token" then
+      _M.apply_token(conf, id, tonumber(number))
+    elseif kind == "user" then
+      _M.apply_user(conf, id, tonumber(number))
+    end
+  end
+end
+
+function _M.publish(conf, red, message)
+  local _, err = red:publish(conf.invalidation_channel, message)
+  if err then
+    return nil, "Redis PUBLISH failed: " .. err
+  end
+  return true
+end
+
+-- Revoke one token until its exp
+function _M.revoke_token(conf, red, signature, exp)
+  local ttl = exp - ngx.time()
+  if ttl <= 0 then
+    -- Already expired, the jwt plugin rejects it anyway
+    return true
+  end
+
+  -- Set the key in Redis with a TTL matching the token's remaining life
+  local ok, err = red:setex(TOKEN_PREFIX .. signature, ttl, "revoked")
+  if not ok then
+    connection.check_error(err)
+    return nil, "Redis SETEX failed: " .. (err or "unknown")
+  end
+
+  _M.apply_token(conf, signature, exp)
+  return _M.publish(conf, red, "token " .. signature .. " " .. exp)
+end
+
+-- User ids end up in Redis keys and space separated messages
+function _M.valid_user_id(sub)
+  return type(sub) == "string" and sub ~= "" and not sub:find("%s")
+end
+
+-- Revoke every token of a user issued before the watermark (default now)
+function _M.revoke_user(conf, red, sub, watermark)
+  if not _M.valid_user_id(sub) then
+    return nil, "invalid user id"
+  end
+  watermark = watermark or ngx.time()
+
+  local ok, err = red:set(USER_PREFIX .. sub, watermark, "EX", conf.max_token_lifetime)
+  if not ok then
+    connection.check_error(err)
+    return nil, "Redis SET failed: " .. (err or "unknown")
+  end
+
+  _M.apply_user(conf, sub, watermark)
+  return _M.publish(conf, red, "user " .. sub .. " " .. watermark)
+end
+
+local function report_error(report, id, err)
+  report.failed = report.failed + 1
+  if #report.errors < MAX_REPORTED_ERRORS then
+    report.errors[#report.errors + 1] = { id = id, error = err }
+  end
+end
+
+-- Send one chunk as a single pipeline and publish what was written as one message.
+-- The subscribers of every node, this one included, apply it to their caches.
+local function flush(conf, red, chunk, report)
+  local now = ngx.time()
+
+  red:init_pipeline(#chunk)
+  for _, entry in ipairs(chunk) do
+    if entry.kind == "token" then
+      red:setex(TOKEN_PREFIX .. entry.id, math.max(entry.number - now, 1), "revoked")
+    else
+      red:set(USER_PREFIX .. entry.id, entry.number, "EX", conf.max_token_lifetime)
+    end
+  end
+
+  local results, err = red:commit_pipeline()
+  if not results then
+    connection.check_error(err)
+    for _, entry in ipairs(chunk) do
+      report_error(report, entry.id, err)
+    end
+    return nil, "Redis pipeline failed: " .. (err or "unknown")
+  end
+
+  local lines = {}
+  for i, res in ipairs(results) do
+    local entry = chunk[i]
+    if type(res) == "table" and res[1] == false then
+      report_error(report, entry.id, res[2])
+    else
+      report.written = report.written + 1
+      lines[#lines + 1] = entry.kind .. " " .. entry.id .. " " .. entry.number
+    end
+  end
+
+  if #lines > 0 then
+    local ok, pub_err = _M.publish(conf, red, concat(lines, "\n"))
+    if not ok then
+      kong.log.err("Blacklist Bulk Revocation Error: ", pub_err)
+    end
+  end
+
+  return true
+end
+
+-- Revoke many tokens ({ signature = ..., exp = ... }) and users (sub strings)
+-- with pipelined writes of conf.bulk_chunk_size commands.
+-- Returns a report with counters, the first errors and the throughput.
+function _M.revoke_batch(conf, red, tokens, users)
+  ngx.update_time()
+  local started = ngx.now()
+  local now = ngx.time()
+
+  local report = {
+    received = #tokens + #users,
+    written = 0,
+    skipped = 0,
+    failed = 0,
+    errors = {},
+  }
+
+  local chunk = {}
+  local aborted
+
+  local function push(entry)
+    if aborted then
+      return report_error(report, entry.id, aborted)
+    end
+
+    chunk[#chunk + 1] = entry
+    if #chunk >= conf.bulk_chunk_size then
+      local ok, err = flush(conf, red, chunk, report)
+      if not ok then
+        -- The connection is unusable after a failed pipeline
+        aborted = err
+      end
+      chunk = {}
+    end
+  end
+
+  for i, token in ipairs(tokens) do
+    local signature = type(token) == "table" and token.signature
+    local exp = type(token) == "table" and tonumber(token.exp)
+
+    if type(signature) ~= "string" or signature == "" or signature:find("%s") or not exp then
+      report_error(report, signature or ("tokens[" .. i .. "]"), "expected { signature, exp }")
+    elseif exp <= now then
+      -- Already expired, the jwt plugin rejects it anyway
+      report.skipped = report.skipped + 1
+    else
+      push({ kind = "token", id = signature, number = math.floor(exp) })
+    end
+  end
+
+  for i, sub in ipairs(users) do
+    if not _M.valid_user_id(sub) then
+      report_error(report, "users[" .. i .. "]", "expected a user id")
+    else
+      push({ kind = "user", id = sub, number = now })
+    end
+  end
+
+  if #chunk > 0 and not aborted then
+    local ok, err = flush(conf, red, chunk, report)
+    if not ok then
+      aborted = err
+    end
+  end
+
+  ngx.update_time()
+  local elapsed = ngx.now() - started
+  report.elapsed_ms = math.floor(elapsed * 1000)
+  report.per_second = elapsed > 0 and math.floor(report.written / elapsed) or report.written
+
+  return report, aborted
+end
+
+return _M
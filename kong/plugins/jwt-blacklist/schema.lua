@@ -10,6 +10,41 @@ return {
           { redis_port = typedefs.port({ default = 6379 }) },
           { redis_password = { type = "string", encrypted = true } }, -- secure storage
           { redis_timeout = { type = "number", default = 1000 } },
+          -- Keepalive pool, connections are authenticated once when opened
+          { redis_pool_size = { type = "integer", default = 100, gt = 0 } },
+          { redis_backlog = { type = "integer", gt = 0 } },
+          { redis_keepalive_timeout = { type = "integer", default = 10000, gt = 0 } },
+          -- Redis Sentinel, takes precedence over redis_host/redis_port when set
+          { redis_sentinel_master = { type = "string" } },
+          { redis_sentinel_addresses = { type = "array", elements = { type = "string" } } },
+          { redis_sentinel_refresh_interval = { type = "number", default = 30, gt = 0 } },
+          -- Send guard reads to a replica, SETEX always goes to the primary
+          { redis_read_from_replicas = { type = "boolean", default = false } },
+          -- Verdict cache (per-worker LRU + lua_shared_dict)
+          { cache_enabled = { type = "boolean", default = true } },
+          { cache_shm = { type = "string", default = "jwt_blacklist" } },
+          { cache_size = { type = "integer", default = 10000, gt = 0 } },
+          -- Seconds a "not revoked" verdict may be served without asking Redis
+          { negative_ttl = { type = "number", default = 5, gt = 0 } },
+          -- Redis pub/sub channel used to push revocations to every worker and node
+          { invalidation_channel = { type = "string", default = "jwt-blacklist:revocations" } },
+          -- Per-user "revoked up to" watermarks compared against the iat claim
+          { revoke_by_user = { type = "boolean", default = true } },
+          -- Longest token lifetime (GoTrue JWT_EXP), watermarks are kept this long
+          { max_token_lifetime = { type = "integer", default = 3600, gt = 0 } },
+          -- Claim naming the jwt credential, as in the jwt plugin; verifies global logouts
+          { key_claim_name = { type = "string", default = "iss" } },
+          -- Commands per pipeline of the bulk revocation endpoint
+          { bulk_chunk_size = { type = "integer", default = 1000, gt = 0 } },
+          -- Bloom filter of revoked signatures, Redis is only asked on a possible match
+          { bloom_enabled = { type = "boolean", default = false } },
+          { bloom_shm = { type = "string", default = "jwt_blacklist_bloom" } },
+          { bloom_capacity = { type = "integer", default = 1000000, gt = 0 } },
+          { bloom_fp_rate = { type = "number", default = 0.001, gt = 0, lt = 1 } },
+          -- Seconds between rebuilds, which also drop signatures of expired tokens
+          { bloom_rebuild_interval = { type = "integer", default = 3600, gt = 0 } },
+          -- Upstream header carrying the sub of a verified token, e.g. for hash balancing
+          { user_header = { type = "string", default = "X-User-Id" } },
         },
     }, },
   },
@@ -0,0 +1,49 @@
+local lrucache = require "resty.lrucache"
+local jwt_parser = require "kong.plugins.jwt.jwt_parser"
+
+-- Parsed JWTs, shared by the plugins that read claims.
+--
+-- The bundled jwt plugin verifies the token but only hands the raw string on
+-- (kong.ctx.shared.authenticated_jwt_token), so every plugin reading a claim
+-- used to decode it again. Tokens the jwt plugin verified are kept parsed in
+-- a per-worker LRU until they expire: repeat requests skip the base64 and
+-- JSON decoding. The signature is still checked by the jwt plugin on every
+-- request, only the decoding is saved.
+local _M = {}
+
+local min = math.min
+
+-- A parsed token is about a KB
+local MAX_TOKENS = 10000
+
+-- Tokens without an exp claim are parsed again after this many seconds
+local MAX_TTL = 3600
+
+local lru = assert(lrucache.new(MAX_TOKENS))
+
+-- Same results as jwt_parser:new(token)
+function _M.parse(token)
+  local jwt = lru:get(token)
+  if jwt then
+    return jwt
+  end
+
+  local err
+  jwt, err = jwt_parser:new(token)
+  if not jwt then
+    return nil, err
+  end
+
+  -- Unverified tokens are not kept, anyone could flood the cache with them
+  if kong.ctx.shared.authenticated_jwt_token == token then
+    local exp = jwt.claims and tonumber(jwt.claims.exp)
+    local ttl = exp and exp - ngx.time() or MAX_TTL
+    if ttl > 0 then
+      lru:set(token, jwt, min(ttl, MAX_TTL))
+    end
+  end
+
+  return jwt
+end
+
+return _M
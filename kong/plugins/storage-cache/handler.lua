@@ -0,0 +1,493 @@
+local cjson = require "cjson.safe"
+local tokens = require "kong.plugins.jwt-blacklist.tokens"
+local connection = require "kong.plugins.jwt-blacklist.connection"
+
+-- Response cache for storage downloads and listings.
+--
+-- GET responses are cached per user in a lua_shared_dict, with Redis as a
+-- second tier shared by every node. Conditional and Range requests hitting
+-- the cache are answered from it with 304 and 206, without the upstream.
+-- Responses over max_body_size only leave their validators in the cache:
+-- conditional requests still get a 304 from it, Range requests go to the
+-- upstream untouched. Keys embed a per-bucket generation: a
+-- successful upload or delete bumps it, which makes every cached entry of the
+-- bucket unreachable at once. With Redis the generations come from INCR
+-- alone, so no two bumps share a number; they are published on a Redis
+-- channel so every node follows immediately. Until its INCR comes back, the
+-- node that took the write marks the bucket dirty and bypasses the cache
+-- for it, so its own clients never read what they just changed.
+local StorageCacheHandler = {
+  VERSION = "1.0.0",
+  PRIORITY = 100,
+}
+
+local concat = table.concat
+local max, min = math.max, math.min
+
+local REDIS_PREFIX = "storage-cache:"
+
+-- A failed bump is retried; the writing node keeps the bucket dirty
+-- meanwhile, other nodes may serve it stale until the entries expire
+local BUMP_RETRIES = 3
+local BUMP_RETRY_DELAY = 1
+
+-- Response headers replayed on a cache hit
+local CACHED_HEADERS = {
+  "Content-Type",
+  "Content-Disposition",
+  "ETag",
+  "Last-Modified",
+  "Cache-Control",
+}
+
+local WRITE_METHODS = {
+  POST = true,
+  PUT = true,
+  PATCH = true,
+  DELETE = true,
+}
+
+-- Whether this worker already follows the invalidation channel
+local subscriber_started = false
+
+-- "/storage/v1/buckets[/<bucket>[/<file>]]" to bucket, file ("" when absent)
+local function parse_path(path)
+  local rest = path:match("^/storage/v1/buckets/?(.*)$")
+  if not rest then
+    return nil
+  end
+
+  local bucket, file = rest:match("^([^/]+)/?(.*)$")
+  return bucket or "", file or ""
+end
+
+local function get_subject()
+  -- Set by the bundled jwt plugin once the token is verified
+  local token = kong.ctx.shared.authenticated_jwt_token
+  if not token then
+    return nil
+  end
+
+  local jwt = tokens.parse(token)
+  return jwt and jwt.claims and jwt.claims.sub
+end
+
+-- Entries are "<meta length as 8 hex digits><meta json><body>"
+local function encode(meta, body)
+  local json = cjson.encode(meta)
+  return string.format("%08x", #json) .. json .. body
+end
+
+local function decode(value)
+  local len = tonumber(value:sub(1, 8), 16)
+  local meta = len and cjson.decode(value:sub(9, 8 + len))
+  if not meta then
+    return nil
+  end
+  return meta, value:sub(9 + len)
+end
+
+-- Weak comparison of an If-None-Match list against the entry's ETag
+local function etag_matches(header, etag)
+  if not etag then
+    return false
+  end
+  if header:match("^%s*%*%s*$") then
+    return true
+  end
+
+  local opaque = etag:gsub("^W/", "")
+  for candidate in header:gmatch("[^,%s]+") do
+    if (candidate:gsub("^W/", "")) == opaque then
+      return true
+    end
+  end
+  return false
+end
+
+-- If-None-Match wins over If-Modified-Since when both are sent
+local function not_modified(headers)
+  local if_none_match = kong.request.get_header("If-None-Match")
+  if if_none_match then
+    return etag_matches(if_none_match, headers.ETag)
+  end
+
+  local since = kong.request.get_header("If-Modified-Since")
+  local last_modified = headers["Last-Modified"]
+  if not since or not last_modified then
+    return false
+  end
+
+  local since_time = ngx.parse_http_time(since)
+  local modified_time = ngx.parse_http_time(last_modified)
+  return since_time and modified_time and modified_time <= since_time or false
+end
+
+-- A Range is only honoured if If-Range still names the cached representation
+local function if_range_matches(headers)
+  local if_range = kong.request.get_header("If-Range")
+  if not if_range then
+    return true
+  end
+
+  if if_range:sub(1, 1) == '"' then
+    -- Strong comparison
+    return if_range == headers.ETag
+  end
+  if if_range:sub(1, 2) == "W/" then
+    return false
+  end
+  return if_range == headers["Last-Modified"]
+end
+
+-- Single "bytes=" range to 0-based first, last offsets in a body of len bytes.
+-- nil when the header is to be ignored (invalid or multiple ranges),
+-- false when the range cannot be satisfied.
+local function parse_range(header, len)
+  local first, last = header:match("^%s*bytes%s*=%s*(%d*)%s*%-%s*(%d*)%s*$")
+  if not first or (first == "" and last == "") then
+    return nil
+  end
+
+  if first == "" then
+    -- Suffix range, the last n bytes
+    local n = tonumber(last)
+    if n == 0 or len == 0 then
+      return false
+    end
+    return max(len - n, 0), len - 1
+  end
+
+  first = tonumber(first)
+  last = last ~= "" and tonumber(last) or len - 1
+  if last < first then
+    return nil
+  end
+  if first >= len then
+    return false
+  end
+  return first, min(last, len - 1)
+end
+
+local function serve(value, cache_status)
+  local meta, body = decode(value)
+  if not meta then
+    return false
+  end
+
+  local headers = meta.headers
+  headers["X-Cache-Status"] = cache_status
+
+  if not_modified(headers) then
+    return kong.response.exit(304, nil, headers)
+  end
+
+  -- Only the validators of a large response are kept, the upstream serves it
+  if meta.validators_only then
+    return false
+  end
+
+  headers["Accept-Ranges"] = "bytes"
+
+  local range = kong.request.get_header("Range")
+  if range and meta.status == 200 and if_range_matches(headers) then
+    local first, last = parse_range(range, #body)
+    if first == false then
+      headers["Content-Range"] = "bytes */" .. #body
+      return kong.response.exit(416, "", headers)
+    end
+
+    if first then
+      headers["Content-Range"] = "bytes " .. first .. "-" .. last .. "/" .. #body
+      return kong.response.exit(206, body:sub(first + 1, last + 1), headers)
+    end
+  end
+
+  return kong.response.exit(meta.status, body, headers)
+end
+
+-- A generation from the channel or Redis only ever moves a bucket forward
+local function raise_generation(shm, bucket, gen)
+  local key = "gen:" .. bucket
+  local current = shm:get(key)
+  if not current or current < gen then
+    shm:set(key, gen)
+  end
+end
+
+local function subscribe(conf)
+  local shm = ngx.shared[conf.shm]
+
+  return connection.subscribe(conf, conf.invalidation_channel, {
+    -- "<generation> <bucket>", bucket being empty for the bucket listing
+    on_message = function(message)
+      local gen, bucket = message:match("^(%d+) ?(.*)$")
+      if gen then
+        raise_generation(shm, bucket, tonumber(gen))
+      end
+    end,
+
+    -- Bumps published while we were not listening are lost, start over from Redis
+    on_subscribed = function()
+      shm:flush_all()
+    end,
+  })
+end
+
+local function store_in_redis(premature, conf, key, value)
+  if premature then
+    return
+  end
+
+  local red, conn_err = connection.connect(conf)
+  if not red then
+    kong.log.err("Storage Cache Connection Error: ", conn_err)
+    return
+  end
+
+  local ok, err = red:set(REDIS_PREFIX .. key, value, "EX", conf.ttl)
+  if not ok then
+    kong.log.err("Storage Cache Redis SET failed: ", err)
+    return red:close()
+  end
+
+  connection.release(conf, red)
+end
+
+local function store(conf, key, meta, body)
+  local value = encode(meta, body)
+  ngx.shared[conf.shm]:set(key, value, conf.ttl)
+
+  if conf.redis_enabled then
+    ngx.timer.at(0, store_in_redis, conf, key, value)
+  end
+end
+
+local function publish_invalidation(premature, conf, bucket, attempt)
+  if premature then
+    return
+  end
+
+  local function retry()
+    if attempt < BUMP_RETRIES then
+      return ngx.timer.at(BUMP_RETRY_DELAY, publish_invalidation, conf, bucket, attempt + 1)
+    end
+    -- The dirty mark stays until it expires with the entries it guards
+    kong.log.err("Storage Cache gave up invalidating bucket '", bucket, "', entries expire after ", conf.ttl, " s")
+  end
+
+  local red, conn_err = connection.connect(conf)
+  if not red then
+    kong.log.err("Storage Cache Connection Error: ", conn_err)
+    return retry()
+  end
+
+  local gen, err = red:incr(REDIS_PREFIX .. "gen:" .. bucket)
+  if not gen then
+    kong.log.err("Storage Cache Redis INCR failed: ", err)
+    red:close()
+    return retry()
+  end
+
+  local shm = ngx.shared[conf.shm]
+  raise_generation(shm, bucket, gen)
+
+  -- Only the last pending bump of the bucket makes it clean again
+  local pending = shm:incr("dirty:" .. bucket, -1)
+  if pending and pending <= 0 then
+    shm:delete("dirty:" .. bucket)
+  end
+
+  local _, pub_err = red:publish(conf.invalidation_channel, gen .. " " .. bucket)
+  if pub_err then
+    kong.log.err("Storage Cache Redis PUBLISH failed: ", pub_err)
+  end
+
+  connection.release(conf, red)
+end
+
+local function invalidate(conf, bucket)
+  local shm = ngx.shared[conf.shm]
+  if not shm then
+    return
+  end
+
+  if not conf.redis_enabled then
+    shm:incr("gen:" .. bucket, 1, 0)
+    return
+  end
+
+  -- The Redis INCR is the only source of generations, a local bump could
+  -- run ahead of it and collide with another node's next bump. The bucket
+  -- is dirty here until then; every entry it hides is gone after ttl.
+  local key = "dirty:" .. bucket
+  shm:incr(key, 1, 0, conf.ttl)
+  shm:expire(key, conf.ttl)
+
+  ngx.timer.at(0, publish_invalidation, conf, bucket, 1)
+end
+
+function StorageCacheHandler:access(conf)
+  local bucket, file = parse_path(kong.request.get_path())
+  if not bucket then
+    return
+  end
+
+  local ctx = kong.ctx.plugin
+  local method = kong.request.get_method()
+
+  if WRITE_METHODS[method] then
+    ctx.invalidate = bucket
+    -- Creating or deleting a bucket also changes the bucket listing
+    ctx.invalidate_listing = file == "" and bucket ~= ""
+    return
+  end
+
+  local shm = ngx.shared[conf.shm]
+  local sub = get_subject()
+  if method ~= "GET" or not shm or not sub then
+    return
+  end
+
+  -- Written through this node, the new generation is not known yet
+  if shm:get("dirty:" .. bucket) then
+    return
+  end
+
+  if conf.redis_enabled and not subscriber_started then
+    subscriber_started = true
+    subscribe(conf)
+  end
+
+  local gen = shm:get("gen:" .. bucket)
+  local key
+  if gen then
+    key = "obj:" .. sub .. ":" .. gen .. ":" .. kong.request.get_path_with_query()
+    local value = shm:get(key)
+    if value then
+      if serve(value, "Hit") ~= false then
+        return
+      end
+      -- Validators only, the upstream serves the body
+      ctx.key = key
+      return
+    end
+  end
+
+  if conf.redis_enabled then
+    local red, conn_err = connection.connect(conf)
+    if not red then
+      kong.log.err("Storage Cache Connection Error: ", conn_err)
+    else
+      if not gen then
+        -- First request for this bucket on this node, adopt the cluster generation
+        local res = red:get(REDIS_PREFIX .. "gen:" .. bucket)
+        raise_generation(shm, bucket, tonumber(res) or 0)
+        gen = shm:get("gen:" .. bucket)
+        key = "obj:" .. sub .. ":" .. gen .. ":" .. kong.request.get_path_with_query()
+      end
+
+      local value, err = red:get(REDIS_PREFIX .. key)
+      if err then
+        kong.log.err("Storage Cache Redis GET failed: ", err)
+        red:close()
+      else
+        connection.release(conf, red)
+        if type(value) == "string" then
+          shm:set(key, value, conf.ttl)
+          if serve(value, "Hit") ~= false then
+            return
+          end
+        end
+      end
+    end
+  end
+
+  if not key then
+    gen = gen or 0
+    key = "obj:" .. sub .. ":" .. gen .. ":" .. kong.request.get_path_with_query()
+  end
+
+  ctx.key = key
+end
+
+function StorageCacheHandler:header_filter(conf)
+  local ctx = kong.ctx.plugin
+  if not ctx.key then
+    return
+  end
+
+  local status = kong.response.get_status()
+  local cache_control = kong.response.get_header("Cache-Control")
+  local length = tonumber(kong.response.get_header("Content-Length"))
+
+  if status ~= 200 or (cache_control and cache_control:find("no-store", 1, true)) then
+    ctx.key = nil
+    return
+  end
+
+  local headers = {}
+  for _, name in ipairs(CACHED_HEADERS) do
+    headers[name] = kong.response.get_header(name)
+  end
+
+  -- The key holds the bucket generation, which every write through the
+  -- gateway bumps: it names this representation for as long as it is cached,
+  -- so the client can revalidate even a miss. Weak, nothing checks the bytes.
+  if not headers.ETag then
+    headers.ETag = 'W/"' .. ngx.md5(ctx.key .. "\0" .. (length or "")) .. '"'
+    kong.response.set_header("ETag", headers.ETag)
+  end
+
+  ctx.meta = { status = status, headers = headers }
+  kong.response.set_header("X-Cache-Status", "Miss")
+
+  if length and length > conf.max_body_size then
+    ctx.meta.validators_only = true
+    store(conf, ctx.key, ctx.meta, "")
+    ctx.key = nil
+    return
+  end
+
+  ctx.chunks = {}
+  ctx.size = 0
+end
+
+function StorageCacheHandler:body_filter(conf)
+  local ctx = kong.ctx.plugin
+  if not ctx.key then
+    return
+  end
+
+  local chunk, eof = ngx.arg[1], ngx.arg[2]
+
+  ctx.size = ctx.size + #chunk
+  if ctx.size > conf.max_body_size then
+    -- Streamed response without Content-Length that turned out too large
+    ctx.meta.validators_only = true
+    store(conf, ctx.key, ctx.meta, "")
+    ctx.key = nil
+    ctx.chunks = nil
+    return
+  end
+
+  ctx.chunks[#ctx.chunks + 1] = chunk
+
+  if eof then
+    store(conf, ctx.key, ctx.meta, concat(ctx.chunks))
+  end
+end
+
+function StorageCacheHandler:log(conf)
+  local ctx = kong.ctx.plugin
+  if not ctx.invalidate or kong.response.get_status() >= 400 then
+    return
+  end
+
+  invalidate(conf, ctx.invalidate)
+  if ctx.invalidate_listing then
+    invalidate(conf, "")
+  end
+end
+
+return StorageCacheHandler
@@ -0,0 +1,28 @@
+local typedefs = require "kong.db.schema.typedefs"
+
+return {
+  name = "storage-cache",
+  fields = {
+    { config = {
+        type = "record",
+        fields = {
+          -- Memory tier, nginx evicts the least recently used entries when it is full
+          { shm = { type = "string", default = "storage_cache" } },
+          -- Seconds a response is served from the cache
+          { ttl = { type = "integer", default = 300, gt = 0 } },
+          -- Larger responses are never cached
+          { max_body_size = { type = "integer", default = 1048576, gt = 0 } },
+          -- Redis tier shared by every node, behind the memory tier
+          { redis_enabled = { type = "boolean", default = true } },
+          { invalidation_channel = { type = "string", default = "storage-cache:invalidations" } },
+          -- Same Redis as jwt-blacklist
+          { redis_host = typedefs.host({ default = "127.0.0.1" }) },
+          { redis_port = typedefs.port({ default = 6379 }) },
+          { redis_timeout = { type = "number", default = 1000 } },
+          { redis_pool_size = { type = "integer", default = 100, gt = 0 } },
+          { redis_backlog = { type = "integer", gt = 0 } },
+          { redis_keepalive_timeout = { type = "integer", default = 10000, gt = 0 } },
+        },
+    }, },
+  },
+}
@@ -0,0 +1,132 @@
+-- migrate:up
+
+-- Object metadata, filled in by the storage service at upload time so
+-- listings never have to ask S3
+ALTER TABLE storage.object
+    ADD COLUMN size BIGINT,
+    ADD COLUMN content_type TEXT,
+    ADD COLUMN etag TEXT,
+    ADD COLUMN checksum TEXT;
+
+-- Keyset pagination and prefix ranges need byte-wise ordering (S3 semantics);
+-- under a linguistic collation keys sharing a prefix are not contiguous
+CREATE INDEX ix_storage_object_bucket_name_c ON storage.object (bucket_id, name COLLATE "C");
+
+-- Return type of storage.list_objects, holds no rows
+CREATE TABLE storage.object_listing (
+    name TEXT NOT NULL,
+    is_prefix BOOLEAN NOT NULL,
+    id UUID,
+    size BIGINT,
+    content_type TEXT,
+    etag TEXT,
+    checksum TEXT,
+    last_modified TIMESTAMPTZ
+);
+
+-- List one page of a bucket in name order, S3 ListObjectsV2 style.
+-- Keys after p_start_after are returned; with a delimiter, keys sharing the
+-- part of the name up to the delimiter are folded into one prefix entry.
+-- Every entry costs one index probe, so memory stays bounded by the page.
+CREATE OR REPLACE FUNCTION storage.list_objects(
+    hasura_session JSON,
+    p_bucket_id UUID,
+    p_prefix TEXT DEFAULT '',
+    p_delimiter TEXT DEFAULT NULL,
+    p_start_after TEXT DEFAULT NULL,
+    p_max_keys INTEGER DEFAULT 1000
+)
+RETURNS SETOF storage.object_listing
+LANGUAGE plpgsql
+STABLE
+AS $$
+DECLARE
+    -- Sorts after every key that starts with a given string
+    max_char CONSTANT TEXT := chr(1114111);
+    -- "> key" is the same as ">= key || chr(1)", chr(1) being the smallest character
+    min_char CONSTANT TEXT := chr(1);
+    v_prefix TEXT := COALESCE(p_prefix, '');
+    v_has_delimiter BOOLEAN := COALESCE(p_delimiter, '') <> '';
+    v_from TEXT := COALESCE(p_prefix, '');
+    v_upper TEXT;
+    v_object storage.object%ROWTYPE;
+    v_rest TEXT;
+    v_pos INTEGER;
+    v_common TEXT;
+    v_count INTEGER := 0;
+BEGIN
+    -- Only the bucket owner (or the admin role of the storage service) may list
+    IF COALESCE(hasura_session ->> 'x-hasura-role', '') <> 'admin' AND NOT EXISTS (
+        SELECT 1
+        FROM storage.bucket b
+        WHERE b.id = p_bucket_id
+          AND b.owner::TEXT = hasura_session ->> 'x-hasura-user-id'
+    ) THEN
+        RETURN;
+    END IF;
+
+    IF v_prefix <> '' THEN
+        v_upper := v_prefix || max_char;
+    END IF;
+
+    IF p_start_after IS NOT NULL AND (p_start_after || min_char) COLLATE "C" > v_from THEN
+        v_from := p_start_after || min_char;
+
+        -- Resuming after a prefix entry skips everything below that prefix
+        IF v_has_delimiter AND length(p_start_after) > length(v_prefix)
+           AND right(p_start_after, length(p_delimiter)) = p_delimiter THEN
+            v_from := p_start_after || max_char;
+        END IF;
+    END IF;
+
+    IF NOT v_has_delimiter THEN
+        RETURN QUERY
+        SELECT o.name, FALSE, o.id, o.size, o.content_type, o.etag, o.checksum, o.last_modified
+        FROM storage.object o
+        WHERE o.bucket_id = p_bucket_id
+          AND o.name COLLATE "C" >= v_from
+          AND (v_upper IS NULL OR o.name COLLATE "C" < v_upper)
+        ORDER BY o.name COLLATE "C"
+        LIMIT p_max_keys;
+        RETURN;
+    END IF;
+
+    WHILE v_count < p_max_keys LOOP
+        SELECT * INTO v_object
+        FROM storage.object o
+        WHERE o.bucket_id = p_bucket_id
+          AND o.name COLLATE "C" >= v_from
+          AND (v_upper IS NULL OR o.name COLLATE "C" < v_upper)
+        ORDER BY o.name COLLATE "C"
+        LIMIT 1;
+
+        EXIT WHEN NOT FOUND;
+
+        v_rest := substr(v_object.name, length(v_prefix) + 1);
+        v_pos := strpos(v_rest, p_delimiter);
+
+        IF v_pos > 0 THEN
+            v_common := v_prefix || substr(v_rest, 1, v_pos + length(p_delimiter) - 1);
+            RETURN NEXT (v_common, TRUE, NULL, NULL, NULL, NULL, NULL, NULL)::storage.object_listing;
+            -- Jump over every key below the common prefix with the next probe
+            v_from := v_common || max_char;
+        ELSE
+            RETURN NEXT (v_object.name, FALSE, v_object.id, v_object.size, v_object.content_type,
+                         v_object.etag, v_object.checksum, v_object.last_modified)::storage.object_listing;
+            v_from := v_object.name || min_char;
+        END IF;
+
+        v_count := v_count + 1;
+    END LOOP;
+END;
+$$;
+
+-- migrate:down
+DROP FUNCTION IF EXISTS storage.list_objects(JSON, UUID, TEXT, TEXT, TEXT, INTEGER);
+DROP TABLE IF EXISTS storage.object_listing;
+DROP INDEX IF EXISTS storage.ix_storage_object_bucket_name_c;
+ALTER TABLE storage.object
+    DROP COLUMN IF EXISTS size,
+    DROP COLUMN IF EXISTS content_type,
+    DROP COLUMN IF EXISTS etag,
+    DROP COLUMN IF EXISTS checksum;
@@ -0,0 +1,41 @@
+-- migrate:up
+
+-- Copy the metadata of many objects in one statement, for batch copies.
+-- The storage service copies the S3 objects, then records them here.
+-- p_target_names[i] is the new name of p_names[i]; an existing target is
+-- overwritten. Names missing from the source bucket are not returned, which
+-- gives the caller its per-item result. Bad items never fail the batch:
+-- arrays of different lengths copy nothing, and of several items writing the
+-- same target only the last one with an existing source is copied, as if
+-- they ran one after the other.
+CREATE OR REPLACE FUNCTION storage.copy_objects(
+    p_source_bucket_id UUID,
+    p_target_bucket_id UUID,
+    p_names TEXT[],
+    p_target_names TEXT[]
+)
+RETURNS SETOF storage.object
+LANGUAGE sql
+VOLATILE
+AS $$
+    INSERT INTO storage.object AS o (name, bucket_id, last_modified, size, content_type, etag, checksum)
+    SELECT DISTINCT ON (t.target_name)
+           t.target_name, p_target_bucket_id, NOW(), s.size, s.content_type, s.etag, s.checksum
+    FROM unnest(p_names, p_target_names) WITH ORDINALITY AS t(name, target_name, position)
+    JOIN storage.object s
+      ON s.bucket_id = p_source_bucket_id
+     AND s.name = t.name
+    WHERE cardinality(p_names) = cardinality(p_target_names)
+      AND t.target_name IS NOT NULL
+    ORDER BY t.target_name, t.position DESC
+    ON CONFLICT (bucket_id, name) DO UPDATE
+    SET last_modified = EXCLUDED.last_modified,
+        size = EXCLUDED.size,
+        content_type = EXCLUDED.content_type,
+        etag = EXCLUDED.etag,
+        checksum = EXCLUDED.checksum
+    RETURNING o.*;
+$$;
+
+-- migrate:down
+DROP FUNCTION IF EXISTS storage.copy_objects(UUID, UUID, TEXT[], TEXT[]);
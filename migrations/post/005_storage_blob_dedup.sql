@@ -0,0 +1,145 @@
+-- migrate:up
+
+-- Content-addressed blobs, stored once in S3 under their digest.
+-- Objects uploaded in dedup mode point at a blob instead of owning their bytes.
+CREATE TABLE storage.blob (
+    digest TEXT PRIMARY KEY,
+    size BIGINT NOT NULL,
+    -- Number of storage.object rows pointing at the blob, kept by triggers
+    ref_count INTEGER NOT NULL DEFAULT 0 CHECK (ref_count >= 0),
+    created_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+    -- Since when ref_count is 0, NULL while referenced
+    unreferenced_at TIMESTAMPTZ DEFAULT NOW()
+);
+
+-- Unreferenced blobs, scanned by storage.collect_blobs
+CREATE INDEX ix_storage_blob_unreferenced ON storage.blob (unreferenced_at) WHERE ref_count = 0;
+
+-- NULL for objects stored the classic way, one S3 object per row
+ALTER TABLE storage.object
+    ADD COLUMN blob_digest TEXT REFERENCES storage.blob (digest);
+
+CREATE INDEX ix_storage_object_blob_digest ON storage.object (blob_digest);
+
+CREATE OR REPLACE FUNCTION storage.track_blob_references()
+RETURNS TRIGGER
+LANGUAGE plpgsql
+AS $$
+BEGIN
+    IF TG_OP IN ('UPDATE', 'DELETE') AND OLD.blob_digest IS NOT NULL THEN
+        UPDATE storage.blob
+        SET ref_count = ref_count - 1,
+            unreferenced_at = CASE WHEN ref_count = 1 THEN NOW() ELSE unreferenced_at END
+        WHERE digest = OLD.blob_digest;
+    END IF;
+
+    IF TG_OP IN ('INSERT', 'UPDATE') AND NEW.blob_digest IS NOT NULL THEN
+        UPDATE storage.blob
+        SET ref_count = ref_count + 1,
+            unreferenced_at = NULL
+        WHERE digest = NEW.blob_digest;
+    END IF;
+
+    RETURN NULL;
+END;
+$$;
+
+CREATE TRIGGER trg_storage_object_blob_references
+AFTER INSERT OR DELETE OR UPDATE OF blob_digest ON storage.object
+FOR EACH ROW
+EXECUTE FUNCTION storage.track_blob_references();
+
+-- Delete the blobs whose last reference went away, or that were never
+-- referenced since they were registered, more than p_grace ago and return
+-- them, so the storage service removes their S3 objects.
+-- The grace period covers uploads that registered a blob but have not
+-- inserted their object row yet; an upload racing the deletion fails on the
+-- foreign key and retries.
+CREATE OR REPLACE FUNCTION storage.collect_blobs(p_grace INTERVAL DEFAULT '1 hour')
+RETURNS SETOF storage.blob
+LANGUAGE sql
+VOLATILE
+AS $$
+    DELETE FROM storage.blob
+    WHERE ref_count = 0
+      AND unreferenced_at < NOW() - p_grace
+    RETURNING *;
+$$;
+
+-- Copies of deduplicated objects share the blob, no S3 copy needed
+CREATE OR REPLACE FUNCTION storage.copy_objects(
+    p_source_bucket_id UUID,
+    p_target_bucket_id UUID,
+    p_names TEXT[],
+    p_target_names TEXT[]
+)
+RETURNS SETOF storage.object
+LANGUAGE sql
+VOLATILE
+AS $$
+    INSERT INTO storage.object AS o (name, bucket_id, last_modified, size, content_type, etag, checksum, blob_digest)
+    SELECT DISTINCT ON (t.target_name)
+           t.target_name, p_target_bucket_id, NOW(), s.size, s.content_type, s.etag, s.checksum, s.blob_digest
+    FROM unnest(p_names, p_target_names) WITH ORDINALITY AS t(name, target_name, position)
+    JOIN storage.object s
+      ON s.bucket_id = p_source_bucket_id
+     AND s.name = t.name
+    WHERE cardinality(p_names) = cardinality(p_target_names)
+      AND t.target_name IS NOT NULL
+    ORDER BY t.target_name, t.position DESC
+    ON CONFLICT (bucket_id, name) DO UPDATE
+    SET last_modified = EXCLUDED.last_modified,
+        size = EXCLUDED.size,
+        content_type = EXCLUDED.content_type,
+        etag = EXCLUDED.etag,
+        checksum = EXCLUDED.checksum,
+        blob_digest = EXCLUDED.blob_digest
+    RETURNING o.*;
+$$;
+
+-- Space saved by deduplication
+CREATE VIEW storage.dedup_stats AS
+SELECT
+    COUNT(o.id) AS objects,
+    COUNT(DISTINCT o.blob_digest) AS blobs,
+    COALESCE(SUM(b.size), 0) AS logical_bytes,
+    COALESCE((SELECT SUM(size) FROM storage.blob), 0) AS stored_bytes,
+    COALESCE(SUM(b.size), 0) - COALESCE((SELECT SUM(size) FROM storage.blob), 0) AS saved_bytes
+FROM storage.object o
+JOIN storage.blob b ON b.digest = o.blob_digest;
+
+-- migrate:down
+DROP VIEW IF EXISTS storage.dedup_stats;
+DROP FUNCTION IF EXISTS storage.collect_blobs(INTERVAL);
+CREATE OR REPLACE FUNCTION storage.copy_objects(
+    p_source_bucket_id UUID,
+    p_target_bucket_id UUID,
+    p_names TEXT[],
+    p_target_names TEXT[]
+)
+RETURNS SETOF storage.object
+LANGUAGE sql
+VOLATILE
+AS $$
+    INSERT INTO storage.object AS o (name, bucket_id, last_modified, size, content_type, etag, checksum)
+    SELECT DISTINCT ON (t.target_name)
+           t.target_name, p_target_bucket_id, NOW(), s.size, s.content_type, s.etag, s.checksum
+    FROM unnest(p_names, p_target_names) WITH ORDINALITY AS t(name, target_name, position)
+    JOIN storage.object s
+      ON s.bucket_id = p_source_bucket_id
+     AND s.name = t.name
+    WHERE cardinality(p_names) = cardinality(p_target_names)
+      AND t.target_name IS NOT NULL
+    ORDER BY t.target_name, t.position DESC
+    ON CONFLICT (bucket_id, name) DO UPDATE
+    SET last_modified = EXCLUDED.last_modified,
+        size = EXCLUDED.size,
+        content_type = EXCLUDED.content_type,
+        etag = EXCLUDED.etag,
+        checksum = EXCLUDED.checksum
+    RETURNING o.*;
+$$;
+DROP TRIGGER IF EXISTS trg_storage_object_blob_references ON storage.object;
+DROP FUNCTION IF EXISTS storage.track_blob_references();
+ALTER TABLE storage.object DROP COLUMN IF EXISTS blob_digest;
+DROP TABLE IF EXISTS storage.blob;
@@ -0,0 +1,42 @@
+-- migrate:up
+
+-- Name to bucket resolution on every storage request, as a single index scan
+CREATE INDEX ix_storage_bucket_name_owner ON storage.bucket (name, owner);
+
+-- Bucket changes are announced on this channel so bucket-metadata caches
+-- (storage service, gateway) drop their entry right away instead of
+-- waiting for their TTL. Payload: {"op", "id", "name", "owner"}, the old
+-- name and owner on delete and rename.
+CREATE OR REPLACE FUNCTION storage.notify_bucket_change()
+RETURNS TRIGGER
+LANGUAGE plpgsql
+AS $$
+DECLARE
+    v_row storage.bucket%ROWTYPE;
+BEGIN
+    IF TG_OP = 'INSERT' THEN
+        v_row := NEW;
+    ELSE
+        v_row := OLD;
+    END IF;
+
+    PERFORM pg_notify('storage_bucket_changes', json_build_object(
+        'op', lower(TG_OP),
+        'id', v_row.id,
+        'name', v_row.name,
+        'owner', v_row.owner
+    )::TEXT);
+
+    RETURN NULL;
+END;
+$$;
+
+CREATE TRIGGER trg_storage_bucket_notify
+AFTER INSERT OR DELETE OR UPDATE OF name, owner ON storage.bucket
+FOR EACH ROW
+EXECUTE FUNCTION storage.notify_bucket_change();
+
+-- migrate:down
+DROP TRIGGER IF EXISTS trg_storage_bucket_notify ON storage.bucket;
+DROP FUNCTION IF EXISTS storage.notify_bucket_change();
+DROP INDEX IF EXISTS storage.ix_storage_bucket_name_owner;
@@ -0,0 +1,302 @@
+-- migrate:up
+
+-- Current status per service, one row each, kept by a true upsert
+CREATE TABLE checks.latest_status (
+    service_name VARCHAR(100) PRIMARY KEY,
+    status VARCHAR(20) NOT NULL CHECK (status IN ('healthy', 'unhealthy', 'unknown')),
+    last_checked_at TIMESTAMP NOT NULL,
+    error_message TEXT,
+    response_time_ms INTEGER
+);
+
+-- Check history in daily partitions, expired days are dropped whole
+CREATE TABLE checks.health_check_history (
+    id BIGINT GENERATED ALWAYS AS IDENTITY,
+    service_name VARCHAR(100) NOT NULL,
+    status VARCHAR(20) NOT NULL CHECK (status IN ('healthy', 'unhealthy', 'unknown')),
+    last_checked_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    error_message TEXT,
+    response_time_ms INTEGER,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+) PARTITION BY RANGE (last_checked_at);
+
+CREATE INDEX idx_health_check_history_service ON checks.health_check_history (service_name, last_checked_at);
+
+-- Single row: history retention and when partitions were last maintained
+CREATE TABLE checks.history_settings (
+    id BOOLEAN PRIMARY KEY DEFAULT TRUE CHECK (id),
+    retention INTERVAL NOT NULL DEFAULT '30 days',
+    days_ahead INTEGER NOT NULL DEFAULT 3,
+    maintained_on DATE NOT NULL DEFAULT '-infinity'
+);
+
+INSERT INTO checks.history_settings DEFAULT VALUES;
+
+-- Create the partitions of the coming days and drop those past retention
+CREATE OR REPLACE FUNCTION checks.maintain_health_check_history(
+    p_retention INTERVAL,
+    p_days_ahead INTEGER,
+    p_from DATE DEFAULT CURRENT_DATE
+)
+RETURNS VOID
+LANGUAGE plpgsql
+AS $$
+DECLARE
+    v_day DATE;
+    v_partition TEXT;
+BEGIN
+    FOR v_day IN
+        SELECT generate_series(p_from, CURRENT_DATE + p_days_ahead, '1 day')::DATE
+    LOOP
+        EXECUTE format(
+            'CREATE TABLE IF NOT EXISTS checks.%I PARTITION OF checks.health_check_history FOR VALUES FROM (%L) TO (%L)',
+            'health_check_history_' || to_char(v_day, 'YYYYMMDD'), v_day, v_day + 1
+        );
+    END LOOP;
+
+    FOR v_partition IN
+        SELECT c.relname
+        FROM pg_inherits i
+        JOIN pg_class c ON c.oid = i.inhrelid
+        WHERE i.inhparent = 'checks.health_check_history'::REGCLASS
+          AND c.relname ~ '^health_check_history_[0-9]{8}$'
+          AND to_date(right(c.relname, 8), 'YYYYMMDD') + 1 <= (LOCALTIMESTAMP - p_retention)::DATE
+    LOOP
+        EXECUTE format('DROP TABLE checks.%I', v_partition);
+    END LOOP;
+END;
+$$;
+
+-- Record a check: append to the history and upsert the latest status
+CREATE OR REPLACE FUNCTION checks.record_health_check(
+    p_service_name VARCHAR(100),
+    p_status VARCHAR(20),
+    p_error_message TEXT,
+    p_response_time_ms INTEGER,
+    p_checked_at TIMESTAMP
+)
+RETURNS BIGINT
+LANGUAGE plpgsql
+AS $$
+DECLARE
+    check_id BIGINT;
+    v_retention INTERVAL;
+    v_days_ahead INTEGER;
+BEGIN
+    -- The first check of the day maintains the partitions, the others skip it
+    UPDATE checks.history_settings
+    SET maintained_on = CURRENT_DATE
+    WHERE maintained_on < CURRENT_DATE
+    RETURNING retention, days_ahead INTO v_retention, v_days_ahead;
+
+    IF FOUND THEN
+        PERFORM checks.maintain_health_check_history(v_retention, v_days_ahead);
+    END IF;
+
+    INSERT INTO checks.health_check_history (
+        service_name,
+        status,
+        error_message,
+        response_time_ms,
+        last_checked_at
+    )
+    VALUES (
+        p_service_name,
+        p_status,
+        p_error_message,
+        p_response_time_ms,
+        p_checked_at
+    )
+    RETURNING id INTO check_id;
+
+    INSERT INTO checks.latest_status AS l (
+        service_name,
+        status,
+        error_message,
+        response_time_ms,
+        last_checked_at
+    )
+    VALUES (
+        p_service_name,
+        p_status,
+        p_error_message,
+        p_response_time_ms,
+        p_checked_at
+    )
+    ON CONFLICT (service_name) DO UPDATE
+    SET status = EXCLUDED.status,
+        error_message = EXCLUDED.error_message,
+        response_time_ms = EXCLUDED.response_time_ms,
+        last_checked_at = EXCLUDED.last_checked_at
+    -- A late check never overwrites a newer one
+    WHERE l.last_checked_at <= EXCLUDED.last_checked_at;
+
+    RETURN check_id;
+END;
+$$;
+
+-- Keep the history within retention when moving it over
+ALTER TABLE checks.health_checks RENAME TO health_checks_legacy;
+
+SELECT checks.maintain_health_check_history(
+    retention,
+    days_ahead,
+    GREATEST(
+        (SELECT MIN(last_checked_at)::DATE FROM checks.health_checks_legacy),
+        (LOCALTIMESTAMP - retention)::DATE
+    )
+)
+FROM checks.history_settings;
+
+UPDATE checks.history_settings SET maintained_on = CURRENT_DATE;
+
+INSERT INTO checks.health_check_history (
+    service_name, status, last_checked_at, error_message, response_time_ms, created_at
+)
+SELECT service_name, status, last_checked_at, error_message, response_time_ms, created_at
+FROM checks.health_checks_legacy
+WHERE last_checked_at >= (SELECT (LOCALTIMESTAMP - retention)::DATE FROM checks.history_settings)
+  AND last_checked_at < CURRENT_DATE + (SELECT days_ahead + 1 FROM checks.history_settings);
+
+INSERT INTO checks.latest_status (service_name, status, last_checked_at, error_message, response_time_ms)
+SELECT DISTINCT ON (service_name)
+    service_name, status, last_checked_at, error_message, response_time_ms
+FROM checks.health_checks_legacy
+WHERE last_checked_at IS NOT NULL
+ORDER BY service_name, last_checked_at DESC;
+
+DROP TABLE checks.health_checks_legacy;
+
+-- The old table name stays readable and writable, inserts go through
+-- checks.record_health_check
+CREATE VIEW checks.health_checks AS
+SELECT id, service_name, status, last_checked_at, error_message, response_time_ms, created_at
+FROM checks.health_check_history;
+
+CREATE OR REPLACE FUNCTION checks.insert_health_check()
+RETURNS TRIGGER
+LANGUAGE plpgsql
+AS $$
+BEGIN
+    NEW.last_checked_at := COALESCE(NEW.last_checked_at, CURRENT_TIMESTAMP);
+    NEW.created_at := COALESCE(NEW.created_at, CURRENT_TIMESTAMP);
+    NEW.id := checks.record_health_check(
+        NEW.service_name, NEW.status, NEW.error_message, NEW.response_time_ms, NEW.last_checked_at
+    );
+    RETURN NEW;
+END;
+$$;
+
+CREATE TRIGGER trg_health_checks_insert
+INSTEAD OF INSERT ON checks.health_checks
+FOR EACH ROW
+EXECUTE FUNCTION checks.insert_health_check();
+
+-- Now returns the BIGINT id of the history row
+DROP FUNCTION checks.upsert_health_check(VARCHAR, VARCHAR, TEXT, INTEGER);
+
+CREATE OR REPLACE FUNCTION checks.upsert_health_check(
+    p_service_name VARCHAR(100),
+    p_status VARCHAR(20),
+    p_error_message TEXT DEFAULT NULL,
+    p_response_time_ms INTEGER DEFAULT NULL
+)
+RETURNS BIGINT
+LANGUAGE sql
+AS $$
+    SELECT checks.record_health_check(
+        p_service_name, p_status, p_error_message, p_response_time_ms, LOCALTIMESTAMP
+    );
+$$;
+
+-- One row per service, straight from latest_status
+CREATE OR REPLACE FUNCTION checks.get_latest_service_status()
+RETURNS TABLE (
+    service_name VARCHAR(100),
+    status VARCHAR(20),
+    last_checked_at TIMESTAMP,
+    error_message TEXT,
+    response_time_ms INTEGER
+)
+LANGUAGE plpgsql
+AS $$
+BEGIN
+    RETURN QUERY
+    SELECT ls.service_name, ls.status, ls.last_checked_at, ls.error_message, ls.response_time_ms
+    FROM checks.latest_status ls
+    ORDER BY ls.service_name;
+END;
+$$;
+
+-- migrate:down
+CREATE TABLE checks.health_checks_restored (
+    id SERIAL PRIMARY KEY,
+    service_name VARCHAR(100) NOT NULL,
+    status VARCHAR(20) NOT NULL CHECK (status IN ('healthy', 'unhealthy', 'unknown')),
+    last_checked_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    error_message TEXT,
+    response_time_ms INTEGER,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+INSERT INTO checks.health_checks_restored (service_name, status, last_checked_at, error_message, response_time_ms, created_at)
+SELECT service_name, status, last_checked_at, error_message, response_time_ms, created_at
+FROM checks.health_check_history
+ORDER BY last_checked_at;
+
+DROP VIEW checks.health_checks;
+DROP FUNCTION IF EXISTS checks.insert_health_check();
+DROP FUNCTION IF EXISTS checks.upsert_health_check(VARCHAR, VARCHAR, TEXT, INTEGER);
+DROP FUNCTION IF EXISTS checks.record_health_check(VARCHAR, VARCHAR, TEXT, INTEGER, TIMESTAMP);
+DROP FUNCTION IF EXISTS checks.maintain_health_check_history(INTERVAL, INTEGER, DATE);
+DROP TABLE checks.health_check_history;
+DROP TABLE checks.history_settings;
+DROP TABLE checks.latest_status;
+
+ALTER TABLE checks.health_checks_restored RENAME TO health_checks;
+ALTER SEQUENCE checks.health_checks_restored_id_seq RENAME TO health_checks_id_seq;
+CREATE INDEX idx_health_checks_service_status ON checks.health_checks(service_name, status);
+CREATE INDEX idx_health_checks_last_checked ON checks.health_checks(last_checked_at);
+
+CREATE OR REPLACE FUNCTION checks.upsert_health_check(
+    p_service_name VARCHAR(100),
+    p_status VARCHAR(20),
+    p_error_message TEXT DEFAULT NULL,
+    p_response_time_ms INTEGER DEFAULT NULL
+)
+RETURNS INTEGER
+LANGUAGE plpgsql
+AS $$
+DECLARE
+    check_id INTEGER;
+BEGIN
+    INSERT INTO checks.health_checks (service_name, status, error_message, response_time_ms, last_checked_at)
+    VALUES (p_service_name, p_status, p_error_message, p_response_time_ms, CURRENT_TIMESTAMP)
+    RETURNING id INTO check_id;
+
+    RETURN check_id;
+END;
+$$;
+
+CREATE OR REPLACE FUNCTION checks.get_latest_service_status()
+RETURNS TABLE (
+    service_name VARCHAR(100),
+    status VARCHAR(20),
+    last_checked_at TIMESTAMP,
+    error_message TEXT,
+    response_time_ms INTEGER
+)
+LANGUAGE plpgsql
+AS $$
+BEGIN
+    RETURN QUERY
+    SELECT DISTINCT ON (hc.service_name)
+        hc.service_name,
+        hc.status,
+        hc.last_checked_at,
+        hc.error_message,
+        hc.response_time_ms
+    FROM checks.health_checks hc
+    ORDER BY hc.service_name, hc.last_checked_at DESC;
+END;
+$$;
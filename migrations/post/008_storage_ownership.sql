@@ -0,0 +1,89 @@
+-- migrate:up
+
+-- The unique index below cannot be built over duplicates; they are left for
+-- an operator to rename or merge, the migration stops and names them
+DO $$
+DECLARE
+    v_duplicates TEXT;
+BEGIN
+    SELECT string_agg(format('%s/%s (%s buckets)', owner, name, n), ', ')
+    INTO v_duplicates
+    FROM (
+        SELECT owner, name, COUNT(*) AS n
+        FROM storage.bucket
+        GROUP BY owner, name
+        HAVING COUNT(*) > 1
+    ) d;
+
+    IF v_duplicates IS NOT NULL THEN
+        RAISE EXCEPTION 'storage.bucket has duplicate (owner, name) pairs: %', v_duplicates
+            USING HINT = 'Rename or merge these buckets, then run the migration again.';
+    END IF;
+END;
+$$;
+
+-- One bucket name per owner; also serves lookups by owner alone and the
+-- (name, owner) resolution, which made ix_storage_bucket_name_owner redundant
+CREATE UNIQUE INDEX ux_storage_bucket_owner_name ON storage.bucket (owner, name);
+DROP INDEX IF EXISTS storage.ix_storage_bucket_name_owner;
+
+-- Owner of the bucket, copied onto every object so row permissions filter
+-- on the object itself instead of joining storage.bucket
+ALTER TABLE storage.object ADD COLUMN owner_id UUID;
+
+UPDATE storage.object o
+SET owner_id = b.owner
+FROM storage.bucket b
+WHERE b.id = o.bucket_id;
+
+-- Per-user listings are answered from the index alone
+CREATE INDEX ix_storage_object_owner_bucket_name ON storage.object (owner_id, bucket_id, name)
+    INCLUDE (id, last_modified, size);
+
+-- owner_id always follows the bucket, whatever the writer sets
+CREATE OR REPLACE FUNCTION storage.set_object_owner()
+RETURNS TRIGGER
+LANGUAGE plpgsql
+AS $$
+BEGIN
+    SELECT b.owner INTO NEW.owner_id
+    FROM storage.bucket b
+    WHERE b.id = NEW.bucket_id;
+
+    RETURN NEW;
+END;
+$$;
+
+CREATE TRIGGER trg_storage_object_owner
+BEFORE INSERT OR UPDATE OF bucket_id, owner_id ON storage.object
+FOR EACH ROW
+EXECUTE FUNCTION storage.set_object_owner();
+
+CREATE OR REPLACE FUNCTION storage.propagate_bucket_owner()
+RETURNS TRIGGER
+LANGUAGE plpgsql
+AS $$
+BEGIN
+    UPDATE storage.object
+    SET owner_id = NEW.owner
+    WHERE bucket_id = NEW.id;
+
+    RETURN NULL;
+END;
+$$;
+
+CREATE TRIGGER trg_storage_bucket_owner
+AFTER UPDATE OF owner ON storage.bucket
+FOR EACH ROW
+WHEN (OLD.owner IS DISTINCT FROM NEW.owner)
+EXECUTE FUNCTION storage.propagate_bucket_owner();
+
+-- migrate:down
+DROP TRIGGER IF EXISTS trg_storage_bucket_owner ON storage.bucket;
+DROP FUNCTION IF EXISTS storage.propagate_bucket_owner();
+DROP TRIGGER IF EXISTS trg_storage_object_owner ON storage.object;
+DROP FUNCTION IF EXISTS storage.set_object_owner();
+DROP INDEX IF EXISTS storage.ix_storage_object_owner_bucket_name;
+ALTER TABLE storage.object DROP COLUMN IF EXISTS owner_id;
+CREATE INDEX IF NOT EXISTS ix_storage_bucket_name_owner ON storage.bucket (name, owner);
+DROP INDEX IF EXISTS storage.ux_storage_bucket_owner_name;
@@ -0,0 +1,133 @@
+import unittest
+import requests
+import json
+import uuid
+import hashlib
+
+# Must match hasura-config/metadata/query_collections.yaml byte for byte
+LIST_BUCKETS = "query list_buckets { storage_bucket(order_by: {name: asc}) { id name } }"
+
+
+class TestGraphqlCache(unittest.TestCase):
+
+    def setUp(self):
+        """Set up test fixtures before each test method"""
+        self.base_url = "http://localhost:8000"
+        self.signup_url = f"{self.base_url}/auth/signup"
+        self.sign_in = f"{self.base_url}/auth/token?grant_type=password"
+
+        self.graphql = f"{self.base_url}/graphql"
+        self.storage_buckets = f"{self.base_url}/storage/v1/buckets"
+        self.headers = {
+            "Content-Type": "application/json"
+        }
+
+        email = f"{str(uuid.uuid4())}@example.com"
+        self.payload = {
+            "email": email,
+            "password": "strongpassword"
+        }
+
+        response = requests.post(
+            self.signup_url,
+            headers=self.headers,
+            data=json.dumps(self.payload)
+        )
+        self.assertEqual(200, response.status_code)
+
+        response_sign_in = requests.post(self.sign_in, headers=self.headers, json=self.payload)
+
+        self.assertIn("access_token", response_sign_in.json())
+
+        self.access_token = response_sign_in.json()["access_token"]
+
+        # Create session
+        self.session = requests.session()
+
+        # Set headers including authorization
+        self.session.headers.update({
+            'Authorization': f'Bearer {self.access_token}',
+            'Content-Type': 'application/json'
+        })
+
+        self.bucket_name = f"test-bucket-{uuid.uuid4()}"
+        response = self.session.post(self.storage_buckets, json={"name": self.bucket_name, "public": False})
+        print(response.json())
+
+    def test_cached_query(self):
+        query = "query @cached(ttl: 30) { storage_bucket { name } }"
+
+        response = self.session.post(self.graphql, json={"query": query})
+        self.assertEqual(response.status_code, 200, response.text)
+        self.assertEqual(response.headers.get("X-Cache-Status"), "Miss")
+
+        response = self.session.post(self.graphql, json={"query": query})
+        self.assertEqual(response.status_code, 200, response.text)
+        self.assertEqual(response.headers.get("X-Cache-Status"), "Hit")
+
+        names = [bucket["name"] for bucket in response.json()["data"]["storage_bucket"]]
+        self.assertEqual(names, [self.bucket_name])
+
+    def test_cache_is_per_user(self):
+        query = "query @cached { storage_bucket { name } }"
+        self.session.post(self.graphql, json={"query": query})
+
+        # Another user asking the same query gets their own result
+        payload = {"email": f"{uuid.uuid4()}@example.com", "password": "strongpassword"}
+        requests.post(self.signup_url, headers=self.headers, json=payload)
+        token = requests.post(self.sign_in, headers=self.headers, json=payload).json()["access_token"]
+
+        response = requests.post(self.graphql, json={"query": query}, headers={
+            "Authorization": f"Bearer {token}",
+        })
+        self.assertEqual(response.status_code, 200, response.text)
+        self.assertEqual(response.headers.get("X-Cache-Status"), "Miss")
+        self.assertEqual(response.json()["data"]["storage_bucket"], [])
+
+    def test_persisted_query(self):
+        persisted = {
+            "extensions": {
+                "persistedQuery": {
+                    "version": 1,
+                    "sha256Hash": hashlib.sha256(LIST_BUCKETS.encode()).hexdigest(),
+                }
+            }
+        }
+
+        response = self.session.post(self.graphql, json=persisted)
+        self.assertEqual(response.status_code, 200, response.text)
+        names = [bucket["name"] for bucket in response.json()["data"]["storage_bucket"]]
+        self.assertEqual(names, [self.bucket_name])
+
+        response = self.session.post(self.graphql, json=persisted)
+        self.assertEqual(response.headers.get("X-Cache-Status"), "Hit")
+
+    def test_unknown_persisted_query(self):
+        response = self.session.post(self.graphql, json={
+            "extensions": {"persistedQuery": {"version": 1, "sha256Hash": "0" * 64}}
+        })
+        self.assertEqual(response.status_code, 200, response.text)
+        self.assertEqual(response.json()["errors"][0]["message"], "PersistedQueryNotFound")
+
+    def test_mutation_not_cached(self):
+        query = "mutation @cached { delete_storage_bucket(where: {name: {_eq: \"missing\"}}) { affected_rows } }"
+        response = self.session.post(self.graphql, json={"query": query})
+        self.assertIsNone(response.headers.get("X-Cache-Status"))
+
+    def test_mutation_behind_a_query_not_cached(self):
+        query = (
+            "# a comment first\n"
+            "query Read @cached { storage_bucket { id } }\n"
+            "mutation Write @cached { delete_storage_bucket(where: {name: {_eq: \"missing\"}}) { affected_rows } }"
+        )
+        for _ in range(2):
+            response = self.session.post(self.graphql, json={"query": query, "operationName": "Write"})
+            self.assertIsNone(response.headers.get("X-Cache-Status"))
+
+    def tearDown(self):
+        """Clean up after each test"""
+        pass
+
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
@@ -0,0 +1,116 @@
+import unittest
+import requests
+import json
+import uuid
+import copy
+import pathlib
+import subprocess
+import threading
+import time
+import yaml
+from concurrent.futures import ThreadPoolExecutor
+
+ROOT = pathlib.Path(__file__).resolve().parent.parent
+
+# Sum of the pool sizes of docker-compose-pooler.yaml with their defaults. The
+# API of docker-compose-api.yaml is not pooled, run this without it.
+POOLED_BACKENDS = 10 + 2 + 20 + 10
+
+BACKENDS_QUERY = "SELECT count(*) FROM pg_stat_activity WHERE backend_type = 'client backend'"
+
+
+def compose(*args):
+    return subprocess.run(
+        ["docker", "compose", "-f", "docker-compose.yaml", "-f", "docker-compose-pooler.yaml", *args],
+        capture_output=True, text=True
+    )
+
+
+def without_rate_limits(declarative):
+    # The load below is far above the per-user limits, it would mostly get 429s
+    config = copy.deepcopy(declarative)
+    for service in config["services"]:
+        service["plugins"] = [p for p in service.get("plugins", []) if "rate-limiting" not in p["name"]]
+    return config
+
+
+def count_backends():
+    # Runs in the postgres container and connects over its local socket, not through PgBouncer
+    result = compose("exec", "-T", "postgres", "sh", "-c",
+                     f'psql -U "$POSTGRES_USER" -d "$POSTGRES_DB" -At -c "{BACKENDS_QUERY}"')
+    return int(result.stdout.strip())
+
+
+class TestPooler(unittest.TestCase):
+
+    def setUp(self):
+        """Set up test fixtures before each test method"""
+        if "pgbouncer" not in compose("ps", "--services", "--status", "running").stdout.split():
+            self.skipTest("the stack is not running with docker-compose-pooler.yaml")
+
+        self.base_url = "http://localhost:8000"
+        self.admin_url = "http://localhost:8001"
+        self.signup_url = f"{self.base_url}/auth/signup"
+        self.sign_in = f"{self.base_url}/auth/token?grant_type=password"
+        self.graphql = f"{self.base_url}/graphql"
+        self.headers = {
+            "Content-Type": "application/json"
+        }
+
+        self.payload = {
+            "email": f"{str(uuid.uuid4())}@example.com",
+            "password": "strongpassword"
+        }
+
+        response = requests.post(self.signup_url, headers=self.headers, data=json.dumps(self.payload))
+        self.assertEqual(200, response.status_code)
+
+        response_sign_in = requests.post(self.sign_in, headers=self.headers, json=self.payload)
+        self.access_token = response_sign_in.json()["access_token"]
+
+    def test_backends_stay_flat_under_load(self):
+        baseline = count_backends()
+        peak = baseline
+        running = True
+
+        def sample():
+            nonlocal peak
+            while running:
+                peak = max(peak, count_backends())
+
+        sampler = threading.Thread(target=sample, daemon=True)
+        sampler.start()
+
+        def sign_in_and_query(_):
+            # GoTrue and Hasura both hit the database on every call
+            sign_in = requests.post(self.sign_in, headers=self.headers, json=self.payload)
+            query = requests.post(self.graphql, json={"query": "{ storage_bucket { id } }"}, headers={
+                "Authorization": f"Bearer {self.access_token}",
+            })
+            return sign_in.status_code, query.status_code
+
+        declarative = yaml.safe_load((ROOT / "kong" / "kong.yaml").read_text())
+        requests.post(f"{self.admin_url}/config", json=without_rate_limits(declarative)).raise_for_status()
+        try:
+            time.sleep(1)
+            with ThreadPoolExecutor(max_workers=200) as pool:
+                statuses = list(pool.map(sign_in_and_query, range(2000)))
+        finally:
+            requests.post(f"{self.admin_url}/config", json=declarative)
+
+        running = False
+        sampler.join()
+
+        print(f"backends: baseline {baseline}, peak {peak}")
+        # A flat backend count only means something if the calls succeeded
+        self.assertEqual([(200, 200)] * len(statuses), statuses)
+        # The sampling psql session counts for one
+        self.assertLessEqual(peak, POOLED_BACKENDS + 1)
+
+    def tearDown(self):
+        """Clean up after each test"""
+        pass
+
+
+if __name__ == '__main__':
+    unittest.main(verbosity=2)
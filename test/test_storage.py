@@ -99,6 +99,62 @@ class TestStorage(unittest.TestCase):
         response = requests.post(f"{self.storage_buckets}/{bucket_name}", files=files, headers=headers)
         self.assertEqual(response.status_code, 201, f"Upload failed: {response.text}")
 
+    def test_upload_large_file(self):
+        bucket_name = f"test-bucket-{uuid.uuid4()}"
+        bucket_data = {"name": bucket_name, "public": False}
+        print(self.session.post(self.storage_buckets, json=bucket_data).json())
+
+        # 2. Prepare a file larger than the proxy buffers
+        file_content = b"0123456789abcdef" * (1024 * 1024)
+        file_name = "large_document.bin"
+
+        files = {
+            'file': (file_name, io.BytesIO(file_content), 'application/octet-stream')
+        }
+
+        headers = {
+            'Authorization': f'Bearer {self.access_token}',
+        }
+
+        response = requests.post(f"{self.storage_buckets}/{bucket_name}", files=files, headers=headers)
+        self.assertEqual(response.status_code, 201, f"Upload failed: {response.text}")
+
+        response = requests.get(f"{self.storage_buckets}/{bucket_name}/{file_name}", headers=headers)
+        self.assertEqual(response.status_code, 200, f"Download failed: {response.text}")
+        self.assertEqual(response.content, file_content, "Downloaded file content does not match original")
+
+    def test_conditional_download_of_large_file(self):
+        bucket_name = f"test-bucket-{uuid.uuid4()}"
+        bucket_data = {"name": bucket_name, "public": False}
+        print(self.session.post(self.storage_buckets, json=bucket_data).json())
+
+        # Larger than the storage cache's max_body_size
+        file_content = b"0123456789abcdef" * (256 * 1024)
+        file_name = "large_video.bin"
+
+        files = {
+            'file': (file_name, io.BytesIO(file_content), 'application/octet-stream')
+        }
+
+        headers = {
+            'Authorization': f'Bearer {self.access_token}',
+        }
+
+        response = requests.post(f"{self.storage_buckets}/{bucket_name}", files=files, headers=headers)
+        self.assertEqual(response.status_code, 201, f"Upload failed: {response.text}")
+
+        file_url = f"{self.storage_buckets}/{bucket_name}/{file_name}"
+
+        # A miss already carries a validator
+        response = requests.get(file_url, headers=headers)
+        self.assertEqual(response.status_code, 200, f"Download failed: {response.text}")
+        self.assertEqual(response.content, file_content)
+        self.assertIn("ETag", response.headers)
+
+        response = requests.get(file_url, headers={**headers, "If-None-Match": response.headers["ETag"]})
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.content, b"")
+
     def test_upload_delete_file(self):
         bucket_name = f"test-bucket-{uuid.uuid4()}"
         bucket_data = {"name": bucket_name, "public": False}
@@ -154,6 +210,85 @@ class TestStorage(unittest.TestCase):
         # Optional: Validate headers sent by FileResponse
         self.assertIn(f'filename="{file_name}"', response.headers["content-disposition"])
 
+    def test_conditional_and_range_download(self):
+        bucket_name = f"test-bucket-{uuid.uuid4()}"
+        bucket_data = {"name": bucket_name, "public": False}
+        print(self.session.post(self.storage_buckets, json=bucket_data).json())
+
+        file_content = b"Hello World, this is a test file."
+        file_name = "range_document.txt"
+
+        files = {
+            'file': (file_name, io.BytesIO(file_content), 'text/plain')
+        }
+
+        headers = {
+            'Authorization': f'Bearer {self.access_token}',
+        }
+
+        response = requests.post(f"{self.storage_buckets}/{bucket_name}", files=files, headers=headers)
+        self.assertEqual(response.status_code, 201, f"Upload failed: {response.text}")
+
+        file_url = f"{self.storage_buckets}/{bucket_name}/{file_name}"
+
+        # The first download fills the cache, the second one is served from it
+        response = requests.get(file_url, headers=headers)
+        self.assertEqual(response.status_code, 200, f"Download failed: {response.text}")
+        response = requests.get(file_url, headers=headers)
+        self.assertEqual(response.headers.get("X-Cache-Status"), "Hit")
+        self.assertIn("ETag", response.headers)
+        etag = response.headers["ETag"]
+
+        response = requests.get(file_url, headers={**headers, "If-None-Match": etag})
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.content, b"")
+
+        response = requests.get(file_url, headers={**headers, "Range": "bytes=0-4"})
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response.content, file_content[:5])
+        self.assertEqual(response.headers["Content-Range"], f"bytes 0-4/{len(file_content)}")
+
+        response = requests.get(file_url, headers={**headers, "Range": "bytes=-5"})
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response.content, file_content[-5:])
+
+        response = requests.get(file_url, headers={**headers, "Range": f"bytes={len(file_content)}-"})
+        self.assertEqual(response.status_code, 416)
+
+    def test_deleted_file_not_served_from_cache(self):
+        bucket_name = f"test-bucket-{uuid.uuid4()}"
+        bucket_data = {"name": bucket_name, "public": False}
+        print(self.session.post(self.storage_buckets, json=bucket_data).json())
+
+        file_content = b"Hello World, this is a test file."
+        file_name = "cached_document.txt"
+
+        files = {
+            'file': (file_name, io.BytesIO(file_content), 'text/plain')
+        }
+
+        headers = {
+            'Authorization': f'Bearer {self.access_token}',
+        }
+
+        response = requests.post(f"{self.storage_buckets}/{bucket_name}", files=files, headers=headers)
+        self.assertEqual(response.status_code, 201, f"Upload failed: {response.text}")
+
+        file_url = f"{self.storage_buckets}/{bucket_name}/{file_name}"
+
+        # Cached once the two downloads are done
+        response = requests.get(file_url, headers=headers)
+        self.assertEqual(response.status_code, 200, f"Download failed: {response.text}")
+        response = requests.get(file_url, headers=headers)
+        self.assertEqual(response.headers.get("X-Cache-Status"), "Hit")
+
+        response = requests.delete(file_url, headers=headers)
+        self.assertEqual(response.status_code, 201, f"Delete failed: {response.text}")
+
+        # Right after the delete, on the node that took it
+        response = requests.get(file_url, headers=headers)
+        self.assertEqual(response.status_code, 404, f"Deleted file served: {response.text}")
+
     def test_download_existing_file_fron_non_existing_bucket(self):
         bucket_name = f"test-bucket-{uuid.uuid4()}"
         bucket_data = {"name": bucket_name, "public": False}
@@ -213,6 +348,100 @@ class TestStorage(unittest.TestCase):
             print(f"checking {fil_e['name']}")
             self.assertIn(fil_e['name'], file_names)
 
+    def test_list_objects_paginated(self):
+        bucket_name = f"test-bucket-{uuid.uuid4()}"
+        bucket_data = {"name": bucket_name, "public": False}
+        print(self.session.post(self.storage_buckets, json=bucket_data).json())
+
+        headers = {
+            'Authorization': f'Bearer {self.access_token}',
+        }
+
+        file_names = ["docs_a.txt", "docs_b.txt", "docs_c.txt", "notes.txt", "readme.txt"]
+
+        for file_name in file_names:
+            files = {
+                'file': (file_name, io.BytesIO(b"Hello World, this is a test file."), 'text/plain')
+            }
+            response = requests.post(f"{self.storage_buckets}/{bucket_name}", files=files, headers=headers)
+            self.assertEqual(response.status_code, 201, f"Upload failed: {response.text}")
+
+        graphql_url = f"{self.base_url}/graphql"
+        response = self.session.post(graphql_url, json={
+            "query": "query ($name: String!) { storage_bucket(where: {name: {_eq: $name}}) { id } }",
+            "variables": {"name": bucket_name},
+        })
+        self.assertEqual(response.status_code, 200, response.text)
+        bucket_id = response.json()["data"]["storage_bucket"][0]["id"]
+
+        query = """
+            query ($args: storage_list_objects_args!) {
+                storage_list_objects(args: $args) { name is_prefix }
+            }
+        """
+
+        def list_page(**args):
+            response = self.session.post(graphql_url, json={
+                "query": query,
+                "variables": {"args": {"p_bucket_id": bucket_id, **args}},
+            })
+            self.assertEqual(response.status_code, 200, response.text)
+            self.assertNotIn("errors", response.json())
+            return response.json()["data"]["storage_list_objects"]
+
+        # Pages of two, each resuming after the last key of the previous one
+        listed = []
+        start_after = None
+        while True:
+            page = list_page(p_max_keys=2, p_start_after=start_after)
+            if not page:
+                break
+            listed += [entry["name"] for entry in page]
+            start_after = page[-1]["name"]
+        self.assertEqual(listed, sorted(file_names))
+
+        # The delimiter folds the docs_ keys into a single prefix entry
+        page = list_page(p_delimiter="_")
+        self.assertEqual(
+            [(entry["name"], entry["is_prefix"]) for entry in page],
+            [("docs_", True), ("notes.txt", False), ("readme.txt", False)],
+        )
+
+        page = list_page(p_prefix="docs_", p_max_keys=10)
+        self.assertEqual([entry["name"] for entry in page], ["docs_a.txt", "docs_b.txt", "docs_c.txt"])
+
+    def test_objects_visible_to_owner_only(self):
+        bucket_name = f"test-bucket-{uuid.uuid4()}"
+        bucket_data = {"name": bucket_name, "public": False}
+        print(self.session.post(self.storage_buckets, json=bucket_data).json())
+
+        headers = {
+            'Authorization': f'Bearer {self.access_token}',
+        }
+
+        files = {
+            'file': ("owned.txt", io.BytesIO(b"Hello World, this is a test file."), 'text/plain')
+        }
+        response = requests.post(f"{self.storage_buckets}/{bucket_name}", files=files, headers=headers)
+        self.assertEqual(response.status_code, 201, f"Upload failed: {response.text}")
+
+        query = {"query": "{ storage_object { name owner_id bucket { name } } }"}
+        graphql_url = f"{self.base_url}/graphql"
+
+        response = self.session.post(graphql_url, json=query)
+        self.assertEqual(response.status_code, 200, response.text)
+        objects = response.json()["data"]["storage_object"]
+        self.assertEqual([(o["name"], o["bucket"]["name"]) for o in objects], [("owned.txt", bucket_name)])
+
+        # Another user does not see them
+        payload = {"email": f"{uuid.uuid4()}@example.com", "password": "strongpassword"}
+        requests.post(self.signup_url, headers=self.headers, json=payload)
+        token = requests.post(self.sign_in, headers=self.headers, json=payload).json()["access_token"]
+
+        response = requests.post(graphql_url, json=query, headers={'Authorization': f'Bearer {token}'})
+        self.assertEqual(response.status_code, 200, response.text)
+        self.assertEqual(response.json()["data"]["storage_object"], [])
+
     def test_download_non_existing_file(self):
         bucket_name = f"test-bucket-{uuid.uuid4()}"
         bucket_data = {"name": bucket_name, "public": False}
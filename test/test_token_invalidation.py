@@ -2,6 +2,8 @@ import unittest
 import requests
 import json
 import uuid
+import base64
+import time
 
 
 class TestLogoutTokenInvalidation(unittest.TestCase):
@@ -9,6 +11,7 @@ class TestLogoutTokenInvalidation(unittest.TestCase):
     def setUp(self):
         """Set up test fixtures before each test method"""
         self.base_url = "http://localhost:8000"
+        self.admin_url = "http://localhost:8001"
         self.signup_url = f"{self.base_url}/auth/signup"
         self.logout_url = f"{self.base_url}/auth/logout"
         self.sign_in = f"{self.base_url}/auth/token?grant_type=password"
@@ -48,6 +51,7 @@ class TestLogoutTokenInvalidation(unittest.TestCase):
         self.assertIn("access_token", response_sign_in.json())
 
         access_token = response_sign_in.json()["access_token"]
+        self.access_token = access_token
 
         # Create session
         self.session = requests.session()
@@ -105,6 +109,109 @@ class TestLogoutTokenInvalidation(unittest.TestCase):
         new_result = self.session.get(url=self.health)
         self.assertEqual(new_result.status_code, 401)
 
+    def test_revoked_token_in_query_argument(self):
+        # The jwt plugin also takes the token from ?jwt=
+        result = requests.get(self.health, params={"jwt": self.access_token})
+        self.assertEqual(result.status_code, 200)
+
+        logout = self.session.post(url=self.logout_url)
+        self.assertEqual(logout.status_code, 204)
+
+        result = requests.get(self.health, params={"jwt": self.access_token})
+        self.assertEqual(result.status_code, 401)
+
+    def test_global_logout_revokes_all_sessions(self):
+        """Test logout with scope=global rejects every token of the user
+
+        The second token may be issued in the same second as the logout,
+        tokens of that second are rejected too.
+        """
+
+        response_sign_in = requests.post(self.sign_in, headers=self.headers, json=self.payload)
+        self.assertIn("access_token", response_sign_in.json())
+
+        other_session = requests.session()
+        other_session.headers.update({
+            'Authorization': f'Bearer {response_sign_in.json()["access_token"]}',
+            'Content-Type': 'application/json'
+        })
+
+        result = other_session.get(url=self.health)
+        self.assertEqual(result.status_code, 200)
+
+        logout = self.session.post(url=f"{self.logout_url}?scope=global")
+        self.assertEqual(logout.status_code, 204)
+
+        new_result = self.session.get(url=self.health)
+        self.assertEqual(new_result.status_code, 401)
+
+        other_result = other_session.get(url=self.health)
+        self.assertEqual(other_result.status_code, 401)
+
+    def test_global_logout_needs_a_signed_token(self):
+        """Test that a forged token cannot log its sub out everywhere"""
+
+        header, payload, _ = self.access_token.split(".")
+        forged = f"{header}.{payload}.{base64.urlsafe_b64encode(b'forged').decode().rstrip('=')}"
+
+        requests.post(
+            url=f"{self.logout_url}?scope=global",
+            headers={"Authorization": f"Bearer {forged}"}
+        )
+
+        result = self.session.get(url=self.health)
+        self.assertEqual(result.status_code, 200)
+
+    def test_bulk_revocation(self):
+        """Test revoking a token through the bulk Admin API endpoint"""
+
+        result = self.session.get(url=self.health)
+        self.assertEqual(result.status_code, 200)
+
+        _, payload, signature = self.access_token.split(".")
+        claims = json.loads(base64.urlsafe_b64decode(payload + "=" * (-len(payload) % 4)))
+
+        response = requests.post(
+            f"{self.admin_url}/jwt-blacklist/revocations",
+            json={"tokens": [{"signature": signature, "exp": claims["exp"]}], "users": []}
+        )
+        self.assertEqual(response.status_code, 201, f"Bulk revocation failed: {response.text}")
+        self.assertEqual(response.json()["written"], 1)
+
+        new_result = self.session.get(url=self.health)
+        self.assertEqual(new_result.status_code, 401)
+
+    def test_user_lockout_rejects_invalid_user_id(self):
+        response = requests.post(f"{self.admin_url}/jwt-blacklist/users/not%20a%20user")
+        self.assertEqual(response.status_code, 400, response.text)
+
+    def blocklist_hits(self):
+        """Sum of the jwt-blacklist lookups that found a revoked token"""
+        response = requests.get(f"{self.admin_url}/metrics")
+        self.assertEqual(response.status_code, 200)
+        total = 0.0
+        for line in response.text.splitlines():
+            if line.startswith("kong_jwt_blacklist_lookups_total{") and 'result="hit"' in line:
+                total += float(line.rsplit(" ", 1)[1])
+        return total
+
+    def test_revoked_lookup_in_metrics(self):
+        """Test that a rejected revoked token shows up in the Prometheus metrics"""
+
+        before = self.blocklist_hits()
+
+        logout = self.session.post(url=self.logout_url)
+        self.assertEqual(logout.status_code, 204)
+
+        result = self.session.get(url=self.health)
+        self.assertEqual(result.status_code, 401)
+
+        # Worker counters reach the shared dict from a timer
+        deadline = time.time() + 5
+        while self.blocklist_hits() <= before and time.time() < deadline:
+            time.sleep(0.5)
+        self.assertGreater(self.blocklist_hits(), before)
+
     def test_no_login_call(self):
         """Test successful user signup"""
 